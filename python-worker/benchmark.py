@@ -0,0 +1,322 @@
+"""
+Benchmarks for selectable vectorizer stages.
+
+    python3 benchmark.py thinning --input ../images/floor-plan-clean.jpg
+    python3 benchmark.py output_format --input ../images/floor-plan-clean.jpg
+    python3 benchmark.py path_b --input ../images/floor-plan-clean.jpg
+    python3 benchmark.py segments --input ../images/floor-plan-clean.jpg
+    python3 benchmark.py pairing --input ../images/floor-plan-clean.jpg
+
+Each subcommand times the alternatives for one stage on a real plan and
+reports how closely their output agrees with the default implementation.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+
+import cv2
+import numpy as np
+
+import processor
+import wallset
+
+
+def time_call(fn, repeat):
+    """Run fn repeat times; return (median seconds, last result)."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+def pixel_agreement(candidate, reference, tolerance=1):
+    """
+    Precision/recall of two binary masks, counting a pixel as matched when
+    the other mask has a pixel within `tolerance` (Chebyshev distance).
+    """
+    kernel = np.ones((2 * tolerance + 1, 2 * tolerance + 1), np.uint8)
+    near_reference = cv2.dilate(reference.astype(np.uint8), kernel) > 0
+    near_candidate = cv2.dilate(candidate.astype(np.uint8), kernel) > 0
+    precision = np.count_nonzero(candidate & near_reference) / max(1, np.count_nonzero(candidate))
+    recall = np.count_nonzero(reference & near_candidate) / max(1, np.count_nonzero(reference))
+    return precision, recall
+
+def sample_walls(walls, width, height, step=2.0):
+    """Points every `step` pixels along each wall centerline, in pixels."""
+    coords = walls.coords.astype(np.float64) * [width / 100.0, height / 100.0]
+    points = [np.empty((0, 2))]
+    for k in range(len(walls)):
+        polyline = coords[walls.offsets[k]:walls.offsets[k + 1]]
+        for a, b in zip(polyline[:-1], polyline[1:]):
+            n = max(2, int(np.linalg.norm(b - a) / step))
+            points.append(np.linspace(a, b, n))
+    return np.concatenate(points)
+
+def wall_agreement(candidate, reference, width, height, tolerance=4.0):
+    """
+    Precision/recall of two WallSets, counting a sampled centerline point as
+    matched when the other set has a sampled point within `tolerance` pixels.
+    """
+    from scipy.spatial import cKDTree
+
+    if not len(candidate) or not len(reference):
+        return 0.0, 0.0
+    cand = sample_walls(candidate, width, height)
+    ref = sample_walls(reference, width, height)
+    precision = np.mean(cKDTree(ref).query(cand)[0] <= tolerance)
+    recall = np.mean(cKDTree(cand).query(ref)[0] <= tolerance)
+    return float(precision), float(recall)
+
+def load_cleaned_binary(image_path):
+    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError(f"Could not read image: {image_path}")
+    return img, processor.preprocess_image(img)
+
+def print_table(rows, columns):
+    widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(w) for c, w in zip(columns, widths)))
+
+# ============================================================================
+# THINNING BACKENDS (Path A, step A.2)
+# ============================================================================
+
+def bench_thinning(args):
+    img, cleaned = load_cleaned_binary(args.input)
+    height, width = cleaned.shape
+    dist_transform = cv2.distanceTransform(cleaned, cv2.DIST_L2, 5)
+    ridge_mask = dist_transform > 3.0
+
+    reference = processor.thin_ridges(ridge_mask, dist_transform, 'skimage')
+
+    rows = []
+    for backend in processor.THINNING_BACKENDS:
+        for per_component in (False, True):
+            try:
+                seconds, skeleton = time_call(
+                    lambda: processor.thin_ridges(ridge_mask, dist_transform, backend, per_component), args.repeat)
+            except RuntimeError as e:
+                processor.log(f"Skipping {backend}: {e}")
+                break
+
+            precision, recall = pixel_agreement(skeleton, reference)
+            walls = processor.detect_filled_walls_ridge(cleaned, width, height, thinning=backend,
+                                                        thinning_per_component=per_component)
+            rows.append({
+                'backend': backend,
+                'per_component': per_component,
+                'ms': round(seconds * 1000.0, 1),
+                'skeleton_px': int(np.count_nonzero(skeleton)),
+                'precision': round(precision, 4),
+                'recall': round(recall, 4),
+                'identical': bool(np.array_equal(skeleton, reference)),
+                'ridge_walls': len(walls),
+            })
+    return rows
+
+# ============================================================================
+# OUTPUT FORMATS (--format)
+# ============================================================================
+
+NODE_BENCH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts', 'bench-wall-binary.js')
+
+def node_parse_ms(paths, repeat):
+    """Median Node parse time per file, or {} when node is not available."""
+    if not shutil.which('node'):
+        processor.log("Skipping Node parse timings: node not found")
+        return {}
+    out = subprocess.run(['node', NODE_BENCH, str(repeat), *paths], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+def bench_output_format(args):
+    result = processor.process_image(args.input)
+    reference = wallset.WallSet.from_records(result['walls'])
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'walls.json')
+
+        def write_json():
+            with open(json_path, 'w') as f:
+                json.dump(result, f)
+
+        def read_json():
+            with open(json_path, 'rb') as f:
+                return json.loads(f.read())
+
+        encode_s, _ = time_call(write_json, args.repeat)
+        parse_s, _ = time_call(read_json, args.repeat)
+        node = node_parse_ms([json_path], args.repeat)
+        rows.append({
+            'format': 'json',
+            'walls_bytes': os.path.getsize(json_path),
+            'sidecar_bytes': 0,
+            'write_ms': round(encode_s * 1000.0, 2),
+            'py_parse_ms': round(parse_s * 1000.0, 2),
+            'node_parse_ms': round(node[json_path], 2) if node else '-',
+            'max_coord_error': 0.0,
+        })
+
+        for coord_format in wallset.COORD_FORMATS:
+            bin_path = os.path.join(tmp, f'walls.{coord_format}')
+            sidecar_path = bin_path + '.json'
+
+            def read_binary():
+                with open(bin_path, 'rb') as f:
+                    walls = wallset.decode_binary(f.read())
+                with open(sidecar_path, 'rb') as f:
+                    return walls, json.loads(f.read())
+
+            encode_s, _ = time_call(lambda: processor.write_binary_output(result, bin_path, coord_format),
+                                    args.repeat)
+            parse_s, (walls, _) = time_call(read_binary, args.repeat)
+            node = node_parse_ms([bin_path, sidecar_path], args.repeat)
+            rows.append({
+                'format': coord_format,
+                'walls_bytes': os.path.getsize(bin_path),
+                'sidecar_bytes': os.path.getsize(sidecar_path),
+                'write_ms': round(encode_s * 1000.0, 2),
+                'py_parse_ms': round(parse_s * 1000.0, 2),
+                'node_parse_ms': round(node[bin_path] + node[sidecar_path], 2) if node else '-',
+                'max_coord_error': round(float(np.abs(walls.coords - reference.coords).max(initial=0.0)), 5),
+            })
+    return rows
+
+# ============================================================================
+# PATH B DETECTORS (--manhattan, segment sources)
+# ============================================================================
+
+PATH_B_DETECTORS = {
+    'lsd': processor.detect_hollow_walls_parallel,
+    'contours': partial(processor.detect_hollow_walls_parallel, segments='contours'),
+    'manhattan': processor.detect_hollow_walls_manhattan,
+}
+
+def bench_path_b(args):
+    img, cleaned = load_cleaned_binary(args.input)
+    height, width = cleaned.shape
+
+    reference = None
+    rows = []
+    for name, detect in PATH_B_DETECTORS.items():
+        seconds, walls = time_call(lambda: detect(cleaned, width, height), args.repeat)
+        if reference is None:
+            reference = walls
+        precision, recall = wall_agreement(walls, reference, width, height)
+        rows.append({
+            'detector': name,
+            'ms': round(seconds * 1000.0, 1),
+            'walls': len(walls),
+            'median_thickness': round(float(np.median(walls.thickness)), 2) if len(walls) else '-',
+            'precision': round(precision, 4),
+            'recall': round(recall, 4),
+        })
+    return rows
+
+# ============================================================================
+# SEGMENT ENGINES (--segments, --merge-segments)
+# ============================================================================
+
+def bench_segments(args):
+    img, cleaned = load_cleaned_binary(args.input)
+    height, width = cleaned.shape
+    reference = processor.detect_hollow_walls_parallel(cleaned, width, height)
+
+    rows = []
+    for engine, detect in processor.SEGMENT_SOURCES.items():
+        try:
+            seconds, lines = time_call(lambda: detect(cleaned), args.repeat)
+        except RuntimeError as e:
+            processor.log(f"Skipping {engine}: {e}")
+            continue
+
+        for merge in (False, True):
+            merge_seconds, segments = 0.0, lines
+            if merge:
+                merge_seconds, segments = time_call(lambda: processor.merge_collinear_segments(lines), args.repeat)
+            walls = processor.pair_parallel_segments(segments, width, height)
+            precision, recall = wall_agreement(walls, reference, width, height)
+            total = seconds + merge_seconds
+            rows.append({
+                'engine': engine,
+                'merged': merge,
+                'ms': round(total * 1000.0, 1),
+                'segments': len(segments),
+                'segments_per_sec': int(len(lines) / total) if total > 0 else '-',
+                'pairs': len(walls),
+                'precision': round(precision, 4),
+                'recall': round(recall, 4),
+            })
+    return rows
+
+# ============================================================================
+# PAIR SELECTION (--pairing)
+# ============================================================================
+
+def bench_pairing(args):
+    img, cleaned = load_cleaned_binary(args.input)
+    height, width = cleaned.shape
+    lines = processor.detect_segments(cleaned)
+    pair_i, pair_j = processor.build_parallel_pair_candidates(lines)
+    angle_diff, gap, overlap, score = processor.score_parallel_pairs(lines, pair_i, pair_j)
+    passes = (angle_diff <= 5) & (gap >= 4) & (gap <= 15) & (overlap >= 0.5) & (score > 0)
+    pair_i, pair_j, score = pair_i[passes], pair_j[passes], score[passes]
+
+    reference = processor.pair_parallel_segments(lines, width, height)
+    rows = []
+    for engine, select in processor.PAIRING_ENGINES.items():
+        select(pair_i, pair_j, score)  # Warm up (imports)
+        seconds, chosen = time_call(lambda: select(pair_i, pair_j, score), args.repeat)
+        walls = processor.pair_parallel_segments(lines, width, height, pairing=engine)
+        precision, recall = wall_agreement(walls, reference, width, height)
+        rows.append({
+            'engine': engine,
+            'candidates': len(pair_i),
+            'ms': round(seconds * 1000.0, 1),
+            'pairs': len(chosen),
+            'total_score': round(float(score[chosen].sum()), 1),
+            'wall_length': round(float(walls.length.sum()), 1),
+            'precision': round(precision, 4),
+            'recall': round(recall, 4),
+        })
+    return rows
+
+BENCHMARKS = {
+    'thinning': (bench_thinning, ['backend', 'per_component', 'ms', 'skeleton_px',
+                                  'precision', 'recall', 'identical', 'ridge_walls']),
+    'output_format': (bench_output_format, ['format', 'walls_bytes', 'sidecar_bytes', 'write_ms',
+                                            'py_parse_ms', 'node_parse_ms', 'max_coord_error']),
+    'path_b': (bench_path_b, ['detector', 'ms', 'walls', 'median_thickness', 'precision', 'recall']),
+    'segments': (bench_segments, ['engine', 'merged', 'ms', 'segments', 'segments_per_sec', 'pairs',
+                                  'precision', 'recall']),
+    'pairing': (bench_pairing, ['engine', 'candidates', 'ms', 'pairs', 'total_score', 'wall_length',
+                                'precision', 'recall']),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vectorizer stage benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--input", required=True, help="Path to input image")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per variant (median is reported)")
+    parser.add_argument("--json", action="store_true", help="Print rows as JSON instead of a table")
+    args = parser.parse_args()
+
+    bench, columns = BENCHMARKS[args.benchmark]
+    rows = bench(args)
+    print(f"# {args.benchmark} on {os.path.basename(args.input)}", file=sys.stderr)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_table(rows, columns)
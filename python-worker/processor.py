@@ -2,17 +2,31 @@ import cv2
 import numpy as np
 import argparse
 import json
+import multiprocessing
+import os
 import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from scipy import ndimage
 from scipy.spatial.distance import cdist
 from skimage.morphology import skeletonize
-from shapely.geometry import LineString, Point
+import shapely
+from shapely import STRtree
+from shapely.geometry import Point
 from shapely.ops import nearest_points
 import warnings
+from result_cache import ResultCache, digest_array, digest_bytes, digest_file
+from wallset import COORD_FORMATS, SOURCE_CODES, SOURCES, WallSet, encode_binary
 
 # Suppress warnings to keep stdout clean
 warnings.filterwarnings("ignore")
 
+PROCESSOR_VERSION = "2.0"
+
 def log(msg):
     """Log to stderr to avoid polluting stdout which is reserved for JSON."""
     sys.stderr.write(f"[INFO] {msg}\n")
@@ -22,35 +36,329 @@ def error(msg):
     sys.stderr.write(f"[ERROR] {msg}\n")
     sys.stderr.flush()
 
-def simplify_coordinates(coords, tolerance=2.0):
+# ============================================================================
+# INSTRUMENTATION
+# ============================================================================
+
+class StageProfiler:
     """
-    Simplify a list of coordinates using the Douglas-Peucker algorithm.
+    Records wall time, CPU time and memory per pipeline stage.
+
+    Stages nest; each record is named by its dotted path (e.g. "preprocess.ocr").
+    Peak traced memory comes from tracemalloc, whose peak counter is process-wide,
+    so peaks of stages running concurrently on different threads overlap.
     """
-    if len(coords) < 3:
-        return coords
 
-    line = LineString(coords)
-    simplified = line.simplify(tolerance, preserve_topology=True)
+    def __init__(self, trace_memory=True):
+        self.records = []
+        self.trace_memory = trace_memory
+        self._owns_tracing = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+        return self
+
+    def stop(self):
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def stage(self, name):
+        return _ProfiledStage(self, name)
+
+    def _enter(self, name):
+        stack = self._stack()
+        if self.trace_memory:
+            if stack:
+                # Fold the peak seen so far into the parent before resetting
+                stack[-1]['peak'] = max(stack[-1]['peak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        path = f"{stack[-1]['path']}.{name}" if stack else name
+        stack.append({'path': path, 'peak': 0,
+                      'wall': time.perf_counter(), 'cpu': time.process_time()})
+
+    def _exit(self):
+        stack = self._stack()
+        frame = stack.pop()
+        record = {
+            'stage': frame['path'],
+            'wall_ms': round((time.perf_counter() - frame['wall']) * 1000.0, 2),
+            'cpu_ms': round((time.process_time() - frame['cpu']) * 1000.0, 2),
+            'max_rss_mb': round(max_rss_mb(), 1),
+        }
+        if self.trace_memory:
+            peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            record['peak_traced_mb'] = round(peak / (1024 * 1024), 2)
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+
+        with self._lock:
+            self.records.append(record)
+        sys.stderr.write(json.dumps({'event': 'stage_timing', **record}) + "\n")
+        sys.stderr.flush()
+
+class _ProfiledStage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler._exit()
+        return False
+
+def max_rss_mb():
+    """Process high-water resident set size in MB (0 where unavailable)."""
+    try:
+        import resource
+        # ru_maxrss is KB on Linux, bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+    except (ImportError, OSError):
+        return 0.0
+
+_NO_STAGE = nullcontext()
+_active_profiler = None
+
+def stage(name):
+    """Context manager timing one pipeline stage; a shared no-op when profiling is off."""
+    if _active_profiler is None:
+        return _NO_STAGE
+    return _active_profiler.stage(name)
 
-    if simplified.is_empty:
-        return []
+# ============================================================================
+# RESULT CACHE
+# ============================================================================
 
-    # Extract coordinates from simplified geometry
-    if simplified.geom_type == 'LineString':
-        return list(simplified.coords)
-    elif simplified.geom_type == 'MultiLineString':
-        result = []
-        for geom in simplified.geoms:
-            result.extend(list(geom.coords))
-        return result
-    else:
-        return coords
+# Source fingerprint: any code change invalidates cached results and intermediates
+def _source_fingerprint(*modules):
+    parts = []
+    for path in modules:
+        with open(path, 'rb') as source:
+            parts.append(source.read())
+    return digest_bytes(b''.join(parts))
+
+CODE_FINGERPRINT = _source_fingerprint(__file__, sys.modules[WallSet.__module__].__file__)
+
+DEFAULT_CACHE_DIR = os.environ.get('VECTORIZER_CACHE_DIR',
+                                   os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+DEFAULT_CACHE_MAX_MB = 512
+
+_active_cache = None
+_cache_reads = True  # Off while profiling: cached entries are still written but never served
+
+# Reasons the current run fell back to incomplete output (e.g. no OCR). Such
+# output is returned but never cached, so a later run with the missing piece
+# fixed recomputes it.
+_degraded = []
+
+def mark_degraded(reason):
+    """Record that this run's output is incomplete and must not be cached."""
+    _degraded.append(reason)
+
+def cached_array(name, source, compute, *args):
+    """
+    Return compute(*args), memoized on disk by stage name, the content of the
+    source array, the non-array arguments and the processor version. Calls
+    compute directly when caching is off. Settings that do not change the
+    result (worker counts) should be bound into compute, e.g. with
+    functools.partial, so they stay out of the key. Values computed while the
+    run was marked degraded are not stored.
+    """
+    if _active_cache is None:
+        return compute(*args)
+
+    params = [arg for arg in args if not isinstance(arg, np.ndarray)]
+    key = _active_cache.key(name, PROCESSOR_VERSION, CODE_FINGERPRINT, digest_array(source), params)
+    value = _active_cache.get_array(key) if _cache_reads else None
+    if value is not None:
+        log(f"  -> Cache hit: {name}")
+        return value
+
+    degraded = len(_degraded)
+    value = compute(*args)
+    if len(_degraded) == degraded:
+        _active_cache.put_array(key, value)
+    return value
+
+def local_indices(counts):
+    """Index of each element within its own segment, for segments of the given sizes."""
+    counts = np.asarray(counts, dtype=np.intp)
+    starts = np.cumsum(counts) - counts
+    return np.arange(int(counts.sum())) - np.repeat(starts, counts)
+
+def segment_sums(values, counts):
+    """
+    Sum a flat array over consecutive segments of the given sizes
+    (np.add.reduceat, with empty segments summing to 0).
+    """
+    counts = np.asarray(counts, dtype=np.intp)
+    sums = np.zeros(len(counts), dtype=np.float64)
+    nonempty = counts > 0
+    if nonempty.any():
+        starts = (np.cumsum(counts) - counts)[nonempty]
+        sums[nonempty] = np.add.reduceat(np.asarray(values, dtype=np.float64), starts)
+    return sums
+
+def polyline_lengths(coords, counts):
+    """
+    Lengths of many polylines stored as one flat (M,2) coordinate array,
+    with counts[k] points belonging to polyline k.
+    """
+    counts = np.asarray(counts, dtype=np.intp)
+    if len(coords) < 2:
+        return np.zeros(len(counts), dtype=np.float64)
+    segments = np.linalg.norm(np.diff(coords, axis=0), axis=1)
+    # Drop the segments that join the last point of one polyline to the next
+    within = local_indices(counts)[1:] != 0
+    return segment_sums(segments[within], np.maximum(counts - 1, 0))
+
+def scale_px(value, scale, minimum=1):
+    """
+    A pixel-size parameter tuned for full-resolution plans, converted to an
+    image decoded at `scale` of full resolution (see --preview).
+    """
+    return max(minimum, int(value * scale + 0.5))
+
+def spawn_process_pool(max_workers=None):
+    """
+    Process pool whose workers are spawned rather than forked. These pools
+    can start while the --threads pool is running, and a forked child of a
+    multithreaded process can deadlock on locks other threads held at fork
+    time (OpenCV, BLAS). Work sent to it must be picklable top-level functions.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+def simplify_polylines(coords, counts, tolerance=2.0):
+    """
+    Douglas-Peucker simplification of many polylines at once.
+
+    Polylines are given as one flat (N, 2) coordinate array plus per-polyline
+    point counts, and are simplified with shapely's vectorized ufuncs instead
+    of one LineString at a time. Returns the simplified flat coordinates and
+    their counts, in the same polyline order.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    counts = np.asarray(counts, dtype=np.intp)
+    if len(counts) == 0:
+        return coords, counts
+
+    # Polylines with fewer than 3 points cannot be simplified; pass them through
+    simplifiable = counts >= 3
+    if not simplifiable.any():
+        return coords, counts
+    owner = np.repeat(np.arange(len(counts)), counts)
+
+    # shapely wants contiguous geometry indices, so rank the simplifiable polylines
+    rank = np.cumsum(simplifiable) - 1
+    in_lines = simplifiable[owner]
+    lines = shapely.linestrings(coords[in_lines], indices=rank[owner[in_lines]])
+    simplified = shapely.simplify(lines, tolerance, preserve_topology=True)
+    out_coords, out_rank = shapely.get_coordinates(simplified, return_index=True)
+
+    new_counts = counts.copy()
+    new_counts[simplifiable] = np.bincount(out_rank, minlength=len(lines))
+
+    # Interleave simplified and passthrough points back into polyline order
+    out_owner = np.concatenate([np.flatnonzero(simplifiable)[out_rank], owner[~in_lines]])
+    merged = np.concatenate([out_coords, coords[~in_lines]])
+    order = np.argsort(out_owner, kind='stable')
+    return merged[order], new_counts
 
 # ============================================================================
 # PHASE 1: PREPROCESSING
 # ============================================================================
 
-def remove_text_regions(img):
+OCR_STRIP_OVERLAP = 64  # Taller than a line of plan text, so every word fits whole in some strip
+
+def ocr_text_boxes(img):
+    """
+    Run Tesseract on one image region. Returns [x, y, w, h] boxes (relative to
+    the region) for words with reasonable confidence.
+    """
+    import pytesseract
+    from PIL import Image
+
+    # Get bounding boxes of text
+    data = pytesseract.image_to_data(Image.fromarray(img), output_type=pytesseract.Output.DICT)
+
+    boxes = []
+    for i in range(len(data['text'])):
+        # Only process if confidence is reasonable
+        if int(data['conf'][i]) > 10:
+            boxes.append([int(data['left'][i]), int(data['top'][i]),
+                          int(data['width'][i]), int(data['height'][i])])
+    return boxes
+
+def plan_ocr_strips(height, strips, overlap=OCR_STRIP_OVERLAP):
+    """
+    Split the page into horizontal strips. Returns (core_y0, core_y1, y0, y1)
+    per strip: the core band the strip owns and the overlapping band it reads.
+    """
+    edges = np.linspace(0, height, strips + 1).round().astype(int)
+    return [(int(edges[k]), int(edges[k + 1]),
+             max(0, int(edges[k]) - overlap), min(height, int(edges[k + 1]) + overlap))
+            for k in range(strips)]
+
+def detect_text_boxes(img, strips=1, processes=None):
+    """
+    OCR the page, optionally as overlapping horizontal strips in a process pool.
+    Each strip's boxes are cached by the strip's pixel content, relative to
+    the strip (identical strips at different heights share an entry). A box found in
+    the overlap of two strips is kept only by the strip whose core band
+    contains the box center, so duplicates are dropped.
+    """
+    height = img.shape[0]
+    plan = plan_ocr_strips(height, strips) if strips > 1 else [(0, height, 0, height)]
+
+    boxes_per_strip = [None] * len(plan)
+    keys = [None] * len(plan)
+    for k, (_, _, y0, y1) in enumerate(plan):
+        if _active_cache is not None:
+            keys[k] = _active_cache.key("ocr_boxes", PROCESSOR_VERSION, CODE_FINGERPRINT,
+                                        digest_array(img[y0:y1]))
+            boxes_per_strip[k] = _active_cache.get_json(keys[k]) if _cache_reads else None
+
+    missing = [k for k, boxes in enumerate(boxes_per_strip) if boxes is None]
+    if len(missing) < len(plan):
+        log(f"  -> OCR cache hit for {len(plan) - len(missing)}/{len(plan)} regions")
+
+    if len(missing) > 1:
+        with spawn_process_pool(processes) as pool:
+            jobs = {k: pool.submit(ocr_text_boxes, img[plan[k][2]:plan[k][3]]) for k in missing}
+            for k, job in jobs.items():
+                boxes_per_strip[k] = job.result()
+    else:
+        for k in missing:
+            boxes_per_strip[k] = ocr_text_boxes(img[plan[k][2]:plan[k][3]])
+
+    if _active_cache is not None:
+        for k in missing:
+            _active_cache.put_json(keys[k], boxes_per_strip[k])
+
+    boxes = []
+    for (core_y0, core_y1, y0, _), strip_boxes in zip(plan, boxes_per_strip):
+        for x, y, w, h in strip_boxes:
+            y += y0  # Strip to page coordinates
+            if core_y0 <= y + h / 2 < core_y1:
+                boxes.append((x, y, w, h))
+    return boxes
+
+def remove_text_regions(img, strips=1, scale=1.0, processes=None):
     """
     Remove text regions using OCR detection.
     Returns binary mask where white=keep, black=remove.
@@ -58,91 +366,92 @@ def remove_text_regions(img):
     log("Phase 1.1: Text removal via OCR...")
 
     try:
-        import pytesseract
-        from PIL import Image
+        import pytesseract  # Availability check; OCR itself runs in ocr_text_boxes
 
-        # Convert to PIL Image
-        pil_img = Image.fromarray(img)
-
-        # Get bounding boxes of text
-        data = pytesseract.image_to_data(pil_img, output_type=pytesseract.Output.DICT)
+        if strips > 1:
+            log(f"  -> OCR on {strips} overlapping strips")
+        boxes = detect_text_boxes(img, strips=strips, processes=processes)
 
         # Create mask (start with all white = keep everything)
         mask = np.ones_like(img, dtype=np.uint8) * 255
 
-        text_boxes_found = 0
-        for i in range(len(data['text'])):
-            # Only process if confidence is reasonable
-            if int(data['conf'][i]) > 10:
-                x, y, w, h = data['left'][i], data['top'][i], data['width'][i], data['height'][i]
-                # Expand bounding box by 8 pixels in all directions
-                padding = 8
-                x1 = max(0, x - padding)
-                y1 = max(0, y - padding)
-                x2 = min(img.shape[1], x + w + padding)
-                y2 = min(img.shape[0], y + h + padding)
-                # Black out text region
-                mask[y1:y2, x1:x2] = 0
-                text_boxes_found += 1
-
-        log(f"  -> Found and masked {text_boxes_found} text regions")
+        for x, y, w, h in boxes:
+            # Expand bounding box by 8 pixels in all directions
+            padding = scale_px(8, scale)
+            x1 = max(0, x - padding)
+            y1 = max(0, y - padding)
+            x2 = min(img.shape[1], x + w + padding)
+            y2 = min(img.shape[0], y + h + padding)
+            # Black out text region
+            mask[y1:y2, x1:x2] = 0
+
+        log(f"  -> Found and masked {len(boxes)} text regions")
         return mask
 
     except ImportError:
         log("  -> pytesseract not available, skipping text removal")
+        mark_degraded("text removal skipped: pytesseract not available")
         return np.ones_like(img, dtype=np.uint8) * 255
     except Exception as e:
         log(f"  -> Text removal failed: {e}, continuing without it")
+        mark_degraded(f"text removal failed: {e}")
         return np.ones_like(img, dtype=np.uint8) * 255
 
-def preprocess_image(img):
+def preprocess_image(img, ocr_strips=1, scale=1.0, processes=None):
     """
     Phase 1: Comprehensive preprocessing to isolate wall-like structures.
-    Returns cleaned binary image.
+    Returns cleaned binary image. ocr_strips > 1 runs OCR as parallel strips.
+    scale < 1 means img was decoded at reduced resolution; pixel-size
+    parameters are scaled to match.
     """
     log("Phase 1: Preprocessing...")
 
     # 1.1: Text Removal
-    text_mask = remove_text_regions(img)
+    with stage("ocr"):
+        # The worker count is bound outside the cache key: it does not change the mask
+        text_mask = cached_array("text_mask", img, partial(remove_text_regions, processes=processes),
+                                 img, ocr_strips, scale)
     img_no_text = cv2.bitwise_and(img, text_mask)
 
     # 1.2: Adaptive Thresholding
     log("Phase 1.2: Adaptive thresholding...")
-    thresh = cv2.adaptiveThreshold(img_no_text, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                   cv2.THRESH_BINARY_INV, 25, 15)
+    with stage("adaptive_threshold"):
+        block_size = scale_px(25, scale, minimum=3) | 1  # Must be odd
+        thresh = cv2.adaptiveThreshold(img_no_text, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                       cv2.THRESH_BINARY_INV, block_size, 15)
 
     # 1.3: Morphological Opening (removes small symbols, dots)
     log("Phase 1.3: Morphological opening to remove noise...")
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
-    opening = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, iterations=1)
+    # Rounded up: at reduced resolution one-pixel strokes must still be opened away
+    kernel_size = int(np.ceil(5 * scale))
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size))
+    with stage("opening"):
+        opening = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, iterations=1)
 
     # 1.4: Connected Component Filtering (RELAXED - walls are long/large!)
     log("Phase 1.4: Connected component filtering...")
-    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(opening, connectivity=8)
-
-    # Create output image (start with zeros)
-    cleaned = np.zeros_like(opening)
+    with stage("components"):
+        num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(opening, connectivity=8)
 
-    components_kept = 0
-    for i in range(1, num_labels):  # Skip background (0)
-        area = stats[i, cv2.CC_STAT_AREA]
-        comp_width = stats[i, cv2.CC_STAT_WIDTH]
-        comp_height = stats[i, cv2.CC_STAT_HEIGHT]
+        area = stats[:, cv2.CC_STAT_AREA]
+        comp_width = stats[:, cv2.CC_STAT_WIDTH]
+        comp_height = stats[:, cv2.CC_STAT_HEIGHT]
 
         # RELAXED Filter criteria - be permissive, let later stages filter
-        if area < 20:  # Tiny noise only
-            continue
-        if comp_width < 8 and comp_height < 8:  # Very small symbols only
-            continue
+        min_side = scale_px(8, scale)
+        keep = area >= scale_px(20, scale ** 2)  # Drop tiny noise only
+        keep &= ~((comp_width < min_side) & (comp_height < min_side))  # Drop very small symbols only
 
         # Aspect ratio check - only remove EXTREME aspect ratios
-        aspect_ratio = max(comp_width, comp_height) / (min(comp_width, comp_height) + 1e-6)
-        if aspect_ratio > 50:  # Only extremely thin lines
-            continue
+        aspect_ratio = np.maximum(comp_width, comp_height) / (np.minimum(comp_width, comp_height) + 1e-6)
+        keep &= aspect_ratio <= 50  # Drop only extremely thin lines
 
-        # Keep this component
-        cleaned[labels == i] = 255
-        components_kept += 1
+        keep[0] = False  # Background
+        components_kept = int(np.count_nonzero(keep))
+
+        # One lookup-table pass over the label image instead of a scan per component
+        lut = np.where(keep, 255, 0).astype(opening.dtype)
+        cleaned = lut[labels]
 
     log(f"  -> Kept {components_kept}/{num_labels-1} components after filtering")
 
@@ -152,16 +461,157 @@ def preprocess_image(img):
 # PATH A: RIDGE DETECTION (FILLED WALLS)
 # ============================================================================
 
-def detect_filled_walls_ridge(binary_img, width, height):
+def thin_skimage(mask, dist_transform):
+    """skimage.morphology.skeletonize (the original Path A thinning)."""
+    return skeletonize(mask)
+
+def thin_ximgproc(mask, dist_transform, thinning_type=0):
+    """OpenCV contrib thinning: thinning_type 0 = Zhang-Suen, 1 = Guo-Hall."""
+    if not hasattr(cv2, 'ximgproc'):
+        raise RuntimeError("This thinning backend needs cv2.ximgproc (install opencv-contrib-python-headless)")
+    return cv2.ximgproc.thinning(mask.astype(np.uint8) * 255, thinningType=thinning_type) > 0
+
+def thin_medial_axis(mask, dist_transform):
+    """
+    Medial-axis thinning that reuses Path A's distance transform: keep pixels
+    that are a local maximum of the distance along at least one of the four
+    line directions, then skeletonize that 1-2 pixel ridge to unit width.
+    The final pass is cheap because thinning iterations scale with stroke width.
+    """
+    height, width = dist_transform.shape
+    padded = np.pad(dist_transform, 1)
+    ridge = np.zeros(mask.shape, dtype=bool)
+    for dy, dx in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        before = padded[1 - dy:1 - dy + height, 1 - dx:1 - dx + width]
+        after = padded[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+        ridge |= (dist_transform >= before) & (dist_transform >= after) & \
+            ((dist_transform > before) | (dist_transform > after))
+    return skeletonize(ridge & mask)
+
+# Selectable thinning step for Path A (--thinning)
+THINNING_BACKENDS = {
+    'skimage': thin_skimage,
+    'zhang-suen': partial(thin_ximgproc, thinning_type=0),
+    'guo-hall': partial(thin_ximgproc, thinning_type=1),
+    'medial-axis': thin_medial_axis,
+}
+
+def thin_ridges(mask, dist_transform, backend='skimage', per_component=False):
+    """
+    Thin the ridge mask to a 1-pixel skeleton with the named backend. With
+    per_component, each connected component is thinned inside its own
+    bounding box (plus a 1px border) instead of the whole page at once.
+    """
+    if backend not in THINNING_BACKENDS:
+        raise ValueError(f"Unknown thinning backend: {backend} (choose from {', '.join(THINNING_BACKENDS)})")
+    thin = THINNING_BACKENDS[backend]
+
+    if not per_component:
+        return thin(mask, dist_transform)
+
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=8)
+    skeleton = np.zeros(mask.shape, dtype=bool)
+    height, width = mask.shape
+    for i in range(1, num_labels):
+        x, y, w, h = stats[i, :4]
+        x0, y0 = max(0, x - 1), max(0, y - 1)
+        x1, y1 = min(width, x + w + 1), min(height, y + h + 1)
+        component = labels[y0:y1, x0:x1] == i
+        skeleton[y0:y1, x0:x1] |= thin(component, dist_transform[y0:y1, x0:x1])
+    return skeleton
+
+# Forward neighbor offsets (dy, dx); with their mirrors they cover 8-connectivity
+SKELETON_OFFSETS = ((0, 1), (1, -1), (1, 0), (1, 1))
+
+def build_skeleton_graph(skeleton):
+    """
+    Sparse pixel graph of a 1-pixel skeleton: one node per skeleton pixel
+    (labelled (x, y)), one edge per pair of 8-connected pixels.
+
+    Diagonal links are dropped where the two pixels already share an
+    orthogonal neighbor, so corners don't form 3-cycles that would read as
+    false junctions.
+    """
+    import networkx as nx
+
+    height, width = skeleton.shape
+    # Pad by one pixel so neighbor lookups never go out of bounds
+    padded = np.zeros((height + 2, width + 2), dtype=bool)
+    padded[1:-1, 1:-1] = skeleton
+    ys, xs = np.nonzero(skeleton)
+    py, px = ys + 1, xs + 1
+
+    graph = nx.Graph()
+    graph.add_nodes_from(zip(xs.tolist(), ys.tolist()))
+
+    for dy, dx in SKELETON_OFFSETS:
+        linked = padded[py + dy, px + dx]
+        if dy and dx:
+            linked &= ~(padded[py, px + dx] | padded[py + dy, px])
+        src = np.flatnonzero(linked)
+        graph.add_edges_from(zip(zip(xs[src].tolist(), ys[src].tolist()),
+                                 zip((xs[src] + dx).tolist(), (ys[src] + dy).tolist())))
+    return graph
+
+def trace_skeleton_graph(skeleton):
+    """
+    Split a skeleton into polylines, one per graph edge between junctions and
+    endpoints (pixels whose degree is not 2). Closed loops without any
+    junction become a single closed polyline. Each centerline is traced once,
+    unlike findContours, which walks both sides of a 1-pixel line.
+    Returns a list of (K,2) integer arrays of (x, y) pixels.
+    """
+    import networkx as nx
+
+    graph = build_skeleton_graph(skeleton)
+    nodes = {n for n, degree in graph.degree() if degree != 2}
+    visited = set()
+
+    def walk(start, nxt):
+        path = [start, nxt]
+        visited.add(frozenset((start, nxt)))
+        prev, cur = start, nxt
+        while cur not in nodes:
+            step = next((n for n in graph.neighbors(cur) if n != prev), None)
+            if step is None or frozenset((cur, step)) in visited:
+                break
+            visited.add(frozenset((cur, step)))
+            path.append(step)
+            prev, cur = cur, step
+        return path
+
+    paths = []
+    for node in sorted(nodes):
+        for neighbor in sorted(graph.neighbors(node)):
+            if frozenset((node, neighbor)) not in visited:
+                paths.append(walk(node, neighbor))
+
+    # Components made only of degree-2 pixels are closed loops
+    for component in nx.connected_components(graph):
+        if len(component) < 3 or not component.isdisjoint(nodes):
+            continue
+        start = min(component)
+        neighbor = min(graph.neighbors(start))
+        paths.append(walk(start, neighbor))
+
+    return [np.array(path, dtype=np.int64) for path in paths]
+
+def detect_filled_walls_ridge(binary_img, width, height, thinning='skimage', thinning_per_component=False,
+                              scale=1.0, origin=(0, 0)):
     """
     Path A: Detect filled/thick walls using distance transform and ridge detection.
-    Returns list of wall vectors with metadata.
+    thinning selects the skeletonization backend (see THINNING_BACKENDS).
+    scale < 1 means a reduced-resolution image; thicknesses are still
+    reported in full-resolution pixels. origin is the (x, y) pixel offset of
+    binary_img within a width x height page, for running on a crop.
+    Returns a WallSet of wall centerlines in 0-100 coordinates.
     """
     log("Path A: Ridge detection for filled walls...")
 
     # A.1: Distance Transform
     log("  A.1: Computing distance transform...")
-    dist_transform = cv2.distanceTransform(binary_img, cv2.DIST_L2, 5)
+    with stage("distance_transform"):
+        dist_transform = cv2.distanceTransform(binary_img, cv2.DIST_L2, 5)
 
     # Normalize for visualization/debugging
     dist_normalized = cv2.normalize(dist_transform, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
@@ -169,250 +619,619 @@ def detect_filled_walls_ridge(binary_img, width, height):
     # A.2: Ridge Extraction (local maxima of distance transform)
     log("  A.2: Extracting ridges (local maxima)...")
     # Threshold distance transform to get thick regions only
-    min_ridge_distance = 3.0  # Minimum thickness/2 (walls must be at least 6px thick)
+    # Minimum thickness/2 (walls must be at least 6px thick). Below full resolution
+    # every stroke pixel has distance >= 1, so that is the floor.
+    min_ridge_distance = max(3.0 * scale, 1.0)
     ridge_mask = (dist_transform > min_ridge_distance).astype(np.uint8) * 255
 
     # Skeletonize the thick regions to get centerlines
     ridge_binary = ridge_mask > 127
-    ridge_skeleton = skeletonize(ridge_binary)
-    ridge_skeleton_uint8 = (ridge_skeleton * 255).astype(np.uint8)
+    with stage("skeletonize"):
+        ridge_skeleton = thin_ridges(ridge_binary, dist_transform, thinning, thinning_per_component)
 
-    # A.3: Extract ridge contours
+    # A.3: Trace ridge centerlines as skeleton graph edges
     log("  A.3: Tracing ridge centerlines...")
-    contours, _ = cv2.findContours(ridge_skeleton_uint8, cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)
-
-    vectors = []
-    for cnt in contours:
-        pts = cnt.reshape(-1, 2).tolist()
-
-        if len(pts) < 10:  # Minimum length for filled walls
-            continue
-
-        # Measure thickness along the ridge
-        thicknesses = []
-        for pt in pts[::5]:  # Sample every 5th point
-            if 0 <= pt[1] < dist_transform.shape[0] and 0 <= pt[0] < dist_transform.shape[1]:
-                thickness = dist_transform[pt[1], pt[0]] * 2  # diameter = 2 * radius
-                thicknesses.append(thickness)
-
-        if not thicknesses:
-            continue
-
-        avg_thickness = np.mean(thicknesses)
-        std_thickness = np.std(thicknesses)
+    with stage("trace"):
+        paths = trace_skeleton_graph(ridge_skeleton)
+    log(f"  -> Skeleton graph has {len(paths)} edges")
+
+    with stage("measure"):
+        # Minimum length for filled walls (a one-sided trace; the old
+        # two-sided contour minimum of 10 points is ~6 pixels of skeleton)
+        min_points = scale_px(6, scale, minimum=2)
+        paths = [path for path in paths if len(path) >= min_points]
+        counts = np.array([len(path) for path in paths], dtype=np.intp)
+        flat = np.concatenate(paths) if paths else np.empty((0, 2), dtype=np.int64)
+
+        # Measure thickness along every ridge at once: every 5th point of each
+        # path, looked up in the distance transform (diameter = 2 * radius),
+        # in full-resolution pixels
+        stride = scale_px(5, scale)
+        sampled = local_indices(counts) % stride == 0
+        sample_counts = (counts + stride - 1) // stride
+        xs, ys = flat[sampled, 0], flat[sampled, 1]
+        thicknesses = dist_transform[ys, xs].astype(np.float64) * 2 / scale
+
+        avg_thickness = segment_sums(thicknesses, sample_counts) / np.maximum(sample_counts, 1)
+        deviations = thicknesses - np.repeat(avg_thickness, sample_counts)
+        std_thickness = np.sqrt(segment_sums(deviations ** 2, sample_counts) / np.maximum(sample_counts, 1))
 
         # Filter by thickness consistency (filled walls have uniform thickness)
-        if avg_thickness < 6 or avg_thickness > 25:  # Outside wall thickness range
-            continue
-        if std_thickness > avg_thickness * 0.4:  # Too variable (not a uniform wall)
-            continue
+        keep = (avg_thickness >= 6) & (avg_thickness <= 25)  # Inside wall thickness range
+        keep &= std_thickness <= avg_thickness * 0.4  # Not too variable (a uniform wall)
 
         # Simplify and normalize
-        simplified_pts = simplify_coordinates(pts, tolerance=2.0)
-        normalized_pts = [[round((p[0] / width) * 100.0, 3), round((p[1] / height) * 100.0, 3)]
-                         for p in simplified_pts]
-
-        if len(normalized_pts) > 1:
-            # Calculate length
-            length = sum(np.linalg.norm(np.array(normalized_pts[i]) - np.array(normalized_pts[i-1]))
-                        for i in range(1, len(normalized_pts)))
-
-            vectors.append({
-                'coords': normalized_pts,
-                'source': 'ridge',
-                'thickness_px': round(avg_thickness, 2),
-                'length_normalized': round(length, 2),
-                'confidence': 0.7  # Single-method detection
-            })
+        kept_points = np.repeat(keep, counts)
+        simplified, wall_counts = simplify_polylines(flat[kept_points], counts[keep], tolerance=2.0 * scale)
+        kept_thickness = avg_thickness[keep]
+        normalized = np.round((simplified + origin) / [width, height] * 100.0, 3)
+        lengths = polyline_lengths(normalized, wall_counts)
 
-    log(f"  -> Path A detected {len(vectors)} filled wall segments")
-    return vectors
+        walls = WallSet.from_polylines(normalized, wall_counts, 'ridge', np.round(kept_thickness, 2),
+                                       0.7,  # Single-method detection
+                                       np.round(lengths, 2))
+        walls = walls.take(wall_counts > 1)
+
+    log(f"  -> Path A detected {len(walls)} filled wall segments")
+    return walls
 
 # ============================================================================
 # PATH B: PARALLEL LINE DETECTION (HOLLOW WALLS)
 # ============================================================================
 
-def detect_hollow_walls_parallel(binary_img, width, height):
+def build_parallel_pair_candidates(lines, min_length=20, max_angle=5.0, max_gap=15.0, max_extension=0.0):
     """
-    Path B: Detect hollow/double-line walls using edge detection and parallel line pairing.
-    Returns list of wall vectors with metadata.
+    Candidate generation for parallel line pairing (Path B, step B.3).
+
+    Segments are bucketed by direction into bins at least max_angle wide, and
+    within each bin sorted by the perpendicular offset of their midpoints
+    (measured along the bin-center normal). A segment is only compared against
+    segments in its own and the two neighboring angle bins whose offset lies
+    within max_gap plus a slack that covers the bin-center vs. true-normal error.
+    The result is a superset of the pairs that pass the angle, distance and
+    overlap tests, so greedy selection over it matches the full O(n^2) scan.
+    max_extension widens the overlap test to projections up to that many
+    pixels apart (used by merge_collinear_segments).
+
+    Returns (pair_i, pair_j) index arrays with pair_i < pair_j, sorted by i then j.
     """
-    log("Path B: Parallel line detection for hollow walls...")
+    empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp))
+    if len(lines) < 2:
+        return empty
+
+    x1, y1, x2, y2 = lines[:, 0], lines[:, 1], lines[:, 2], lines[:, 3]
+    # Same dtype/arithmetic as line_length so the length cutoff agrees exactly
+    lengths = np.sqrt((x2 - x1)**2 + (y2 - y1)**2)
+    angles = np.degrees(np.arctan2(y2 - y1, x2 - x1)).astype(np.float64)
+
+    valid = np.flatnonzero(lengths >= min_length)
+    if len(valid) < 2:
+        return empty
+
+    n_bins = max(1, int(360.0 // max_angle))
+    bin_width = 360.0 / n_bins
+    bins = (np.floor((angles[valid] + 180.0) / bin_width).astype(np.intp)) % n_bins
+
+    mid_x = ((x1 + x2) / 2).astype(np.float64)[valid]
+    mid_y = ((y1 + y2) / 2).astype(np.float64)[valid]
+    valid_lengths = lengths[valid].astype(np.float64)
+    valid_angles = angles[valid]
+
+    members_by_bin = [np.flatnonzero(bins == b) for b in range(n_bins)]
+
+    all_i = []
+    all_j = []
+    for b in range(n_bins):
+        members = members_by_bin[b]
+        if len(members) == 0:
+            continue
 
-    # B.1: Edge Detection
-    log("  B.1: Canny edge detection...")
-    # Slight blur to reduce noise
-    blurred = cv2.GaussianBlur(binary_img, (3, 3), 0.8)
-    edges = cv2.Canny(blurred, 40, 120)
+        center = -180.0 + (b + 0.5) * bin_width
+        nx, ny = -np.sin(np.radians(center)), np.cos(np.radians(center))
 
-    # B.2: Line Segment Detection using LSD
-    log("  B.2: Line segment detection (LSD)...")
-    lsd = cv2.createLineSegmentDetector(0)
-    lines, widths, prec, nfa = lsd.detect(edges)
+        member_offsets = mid_x[members] * nx + mid_y[members] * ny
+        order = np.argsort(member_offsets, kind='stable')
+        sorted_offsets = member_offsets[order]
+        sorted_members = members[order]
+        max_member_length = valid_lengths[members].max()
 
-    if lines is None or len(lines) == 0:
-        log("  -> No lines detected by LSD")
-        return []
+        neighbor_bins = {(b - 1) % n_bins, b, (b + 1) % n_bins}
+        queries = np.concatenate([members_by_bin[nb] for nb in neighbor_bins])
+        if len(queries) == 0:
+            continue
 
-    lines = lines.reshape(-1, 4)  # [[x1, y1, x2, y2], ...]
-    log(f"  -> LSD found {len(lines)} line segments")
+        # Deviation of each query's own normal from this bin's center normal
+        deviation = np.abs(valid_angles[queries] - center) % 360.0
+        deviation = np.minimum(deviation, 360.0 - deviation)
+        normal_error = 2.0 * np.sin(np.radians(deviation) / 2.0)
 
-    # B.3: Parallel Line Pairing
-    log("  B.3: Pairing parallel lines...")
+        # Overlap bounds the along-line midpoint separation by (L1 + L2) / 2 (+ max_extension)
+        max_separation = np.hypot((valid_lengths[queries] + max_member_length) / 2.0 + max_extension, max_gap)
+        reach = max_gap + max_separation * normal_error + 1e-3
 
-    def line_angle(line):
-        """Calculate angle of line in degrees."""
-        x1, y1, x2, y2 = line
-        return np.degrees(np.arctan2(y2 - y1, x2 - x1))
+        query_offsets = mid_x[queries] * nx + mid_y[queries] * ny
+        lo = np.searchsorted(sorted_offsets, query_offsets - reach, side='left')
+        hi = np.searchsorted(sorted_offsets, query_offsets + reach, side='right')
 
-    def line_length(line):
-        """Calculate length of line."""
-        x1, y1, x2, y2 = line
-        return np.sqrt((x2 - x1)**2 + (y2 - y1)**2)
+        counts = hi - lo
+        total = int(counts.sum())
+        if total == 0:
+            continue
 
-    def perpendicular_distance(line1, line2):
-        """Calculate perpendicular distance between two parallel lines."""
-        x1, y1, x2, y2 = line1
-        x3, y3, x4, y4 = line2
+        query_rep = np.repeat(queries, counts)
+        run_starts = np.repeat(np.cumsum(counts) - counts, counts)
+        positions = np.repeat(lo, counts) + (np.arange(total) - run_starts)
+        candidate_rep = sorted_members[positions]
 
-        # Midpoint of line1
-        mx1, my1 = (x1 + x2) / 2, (y1 + y2) / 2
-        # Midpoint of line2
-        mx2, my2 = (x3 + x4) / 2, (y3 + y4) / 2
+        keep = valid[candidate_rep] > valid[query_rep]
+        all_i.append(valid[query_rep[keep]])
+        all_j.append(valid[candidate_rep[keep]])
 
-        # Vector of line1
-        dx, dy = x2 - x1, y2 - y1
-        length = np.sqrt(dx**2 + dy**2)
-        if length < 1e-6:
-            return float('inf')
+    if not all_i:
+        return empty
 
-        # Unit perpendicular vector
-        perp_x, perp_y = -dy / length, dx / length
+    pair_i = np.concatenate(all_i)
+    pair_j = np.concatenate(all_j)
+    order = np.lexsort((pair_j, pair_i))
+    return pair_i[order], pair_j[order]
 
-        # Distance from midpoint of line2 to line1
-        dist = abs((mx2 - mx1) * perp_x + (my2 - my1) * perp_y)
-        return dist
+def score_parallel_pairs(lines, pair_i, pair_j):
+    """
+    Batched scoring kernel for candidate wall pairs.
+
+    Takes an (N,4) segment array and candidate index arrays, and returns
+    (angle_diff, gap, overlap, score) arrays, one entry per candidate. Line i
+    is the reference line for the gap and overlap measurements.
+    """
+    x1, y1, x2, y2 = lines[pair_i].T
+    x3, y3, x4, y4 = lines[pair_j].T
 
-    def lines_overlap_parallel(line1, line2):
-        """Check if two lines overlap in their parallel direction (0-1 overlap ratio)."""
-        x1, y1, x2, y2 = line1
-        x3, y3, x4, y4 = line2
+    dx, dy = x2 - x1, y2 - y1
+    length1_sq = dx**2 + dy**2
+    length1 = np.sqrt(length1_sq)
+    length2 = np.sqrt((x4 - x3)**2 + (y4 - y3)**2)
 
-        # Project line2 endpoints onto line1
-        dx, dy = x2 - x1, y2 - y1
-        length1_sq = dx**2 + dy**2
+    # Parallelism (directed angles, wrapped to [0, 180])
+    angle_diff = np.abs(np.degrees(np.arctan2(dy, dx)) - np.degrees(np.arctan2(y4 - y3, x4 - x3)))
+    angle_diff = np.where(angle_diff > 180, 360 - angle_diff, angle_diff)
 
-        if length1_sq < 1e-6:
-            return 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Perpendicular distance from line2's midpoint to line1
+        mx1, my1 = (x1 + x2) / 2, (y1 + y2) / 2
+        mx2, my2 = (x3 + x4) / 2, (y3 + y4) / 2
+        perp_x, perp_y = -dy / length1, dx / length1
+        gap = np.abs((mx2 - mx1) * perp_x + (my2 - my1) * perp_y)
+        gap = np.where(length1 < 1e-6, np.inf, gap)
 
-        # Parameter t for projection: P = line1_start + t * line1_vector
+        # Overlap of line2's projection with line1's [0, 1] parameter range
         t3 = ((x3 - x1) * dx + (y3 - y1) * dy) / length1_sq
         t4 = ((x4 - x1) * dx + (y4 - y1) * dy) / length1_sq
+        overlap_start = np.maximum(0, np.minimum(t3, t4))
+        overlap_end = np.minimum(1, np.maximum(t3, t4))
+        overlap = np.maximum(0, overlap_end - overlap_start)
+        overlap = np.where(length1_sq < 1e-6, 0, overlap)
+
+        score = overlap * np.minimum(length1, length2) / (1 + np.abs(gap - 8))  # Prefer ~8px gap
+
+    return angle_diff, gap, overlap, score
+
+def detect_edges(binary_img):
+    """Path B step B.1: Canny edges of the slightly blurred cleaned binary."""
+    log("  B.1: Canny edge detection...")
+    # Slight blur to reduce noise
+    with stage("canny"):
+        blurred = cv2.GaussianBlur(binary_img, (3, 3), 0.8)
+        return cv2.Canny(blurred, 40, 120)
+
+def canonical_directions(lines):
+    """
+    Orient segments into [-67.5, 112.5) degrees (in place), so both sides of
+    a stroke point the same way, as pairing requires. The cut sits between
+    the common 90 and 135 degree wall angles; near-vertical segments all
+    point down. Returns lines.
+    """
+    angle = np.degrees(np.arctan2(lines[:, 3] - lines[:, 1], lines[:, 2] - lines[:, 0]))
+    flip = (angle < -67.5) | (angle >= 112.5)
+    lines[flip] = lines[flip][:, [2, 3, 0, 1]]
+    return lines
+
+def detect_line_segments(binary_img):
+    """
+    Path B steps B.1-B.2: Canny edges, then LSD line segments.
+    Returns an (N,4) float32 array of [x1, y1, x2, y2] rows (N may be 0).
+    """
+    # B.1: Edge Detection
+    edges = detect_edges(binary_img)
+
+    # B.2: Line Segment Detection using LSD
+    log("  B.2: Line segment detection (LSD)...")
+    with stage("lsd"):
+        lsd = cv2.createLineSegmentDetector(0)
+        lines, widths, prec, nfa = lsd.detect(edges)
+
+    if lines is None:
+        return np.empty((0, 4), dtype=np.float32)
+    return lines.reshape(-1, 4)  # [[x1, y1, x2, y2], ...]
+
+def detect_fld_segments(binary_img):
+    """
+    Path B step B.2 with OpenCV contrib's FastLineDetector, which runs its own
+    Canny on the blurred binary. Needs cv2.ximgproc.
+    """
+    if not hasattr(cv2, 'ximgproc'):
+        raise RuntimeError("The fld segment detector needs cv2.ximgproc (install opencv-contrib-python-headless)")
+    log("  B.1-B.2: Fast line detector...")
+    with stage("fld"):
+        blurred = cv2.GaussianBlur(binary_img, (3, 3), 0.8)
+        fld = cv2.ximgproc.createFastLineDetector(length_threshold=10, canny_th1=40, canny_th2=120)
+        lines = fld.detect(blurred)
+
+    if lines is None:
+        return np.empty((0, 4), dtype=np.float32)
+    return canonical_directions(lines.reshape(-1, 4).astype(np.float32))
+
+def detect_hough_segments(binary_img):
+    """
+    Path B step B.2 with the probabilistic Hough transform on the Canny edges.
+    Segments shorter than pairing's 20 px minimum are not reported.
+    """
+    edges = detect_edges(binary_img)
+    log("  B.2: Probabilistic Hough segments...")
+    with stage("hough"):
+        lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=30, minLineLength=20, maxLineGap=3)
+
+    if lines is None:
+        return np.empty((0, 4), dtype=np.float32)
+    return canonical_directions(lines.reshape(-1, 4).astype(np.float32))
 
-        # Overlap range on line1's parameter space [0, 1]
-        overlap_start = max(0, min(t3, t4))
-        overlap_end = min(1, max(t3, t4))
+CONTOUR_EPSILON = 2.0  # approxPolyDP tolerance in pixels; absorbs 1-pixel jogs
 
-        overlap = max(0, overlap_end - overlap_start)
-        return overlap
+def detect_contour_segments(binary_img, epsilon=CONTOUR_EPSILON):
+    """
+    Path B steps B.1-B.2 without Canny/LSD: trace the cleaned mask's
+    boundaries with findContours, approximate each with approxPolyDP and
+    emit the polygon sides as segments. Sides are moved half a pixel out of
+    the foreground so they lie on the pixel boundary (see canonical_directions
+    for their orientation).
+    Returns an (N,4) float32 array of [x1, y1, x2, y2] rows (N may be 0).
+    """
+    log("  B.1-B.2: Boundary segments from contours...")
+    with stage("contours"):
+        contours, _ = cv2.findContours(binary_img, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        sides = [np.empty((0, 4), dtype=np.float32)]
+        for contour in contours:
+            polygon = cv2.approxPolyDP(contour, epsilon, True).reshape(-1, 2)
+            if len(polygon) > 1:
+                sides.append(np.hstack([polygon, np.roll(polygon, -1, axis=0)]).astype(np.float32))
+        lines = np.concatenate(sides)
+
+    lines = canonical_directions(lines[np.any(lines[:, :2] != lines[:, 2:], axis=1)])
+    direction = lines[:, 2:] - lines[:, :2]
+    length = np.hypot(direction[:, 0], direction[:, 1])
+
+    # Outward normal: whichever side of the midpoint is background
+    height, width = binary_img.shape
+    normal = np.stack([-direction[:, 1], direction[:, 0]], axis=1) / length[:, None]
+    probe = np.round((lines[:, :2] + lines[:, 2:]) / 2 + normal).astype(np.intp)
+    probe_x, probe_y = probe[:, 0].clip(0, width - 1), probe[:, 1].clip(0, height - 1)
+    outward = np.where((binary_img[probe_y, probe_x] == 0)[:, None], normal, -normal)
+    return lines + 0.5 * np.hstack([outward, outward])
+
+# Segment detector engines for Path B steps B.1-B.2 (--segments). Each takes
+# the cleaned binary and returns an (N,4) float32 [x1, y1, x2, y2] array.
+SEGMENT_SOURCES = {
+    'lsd': detect_line_segments,
+    'contours': detect_contour_segments,
+    'fld': detect_fld_segments,
+    'hough': detect_hough_segments,
+}
+
+def detect_segments(binary_img, segments='lsd'):
+    """Run the named segment engine (see SEGMENT_SOURCES), cached by input."""
+    if segments not in SEGMENT_SOURCES:
+        raise ValueError(f"Unknown segment source: {segments} (choose from {', '.join(SEGMENT_SOURCES)})")
+    return cached_array(f"{segments}_segments", binary_img, SEGMENT_SOURCES[segments], binary_img)
+
+MERGE_MAX_ANGLE = 2.0   # Degrees between collinear fragments (directed, so edge sides stay apart)
+MERGE_MAX_OFFSET = 1.0  # Pixels between fragment lines; well under the 4 px minimum wall gap
+MERGE_MAX_GAP = 4.0     # Pixels of end-to-end gap bridged along the line
+
+def merge_collinear_segments(lines, max_angle=MERGE_MAX_ANGLE, max_offset=MERGE_MAX_OFFSET,
+                             max_gap=MERGE_MAX_GAP):
+    """
+    Path B step B.2 post-pass: merge collinear fragments into maximal segments.
+
+    Candidate fragment pairs come from the orientation/offset index
+    (build_parallel_pair_candidates), which also compares neighboring angle
+    bins, so fragments on either side of a bin edge (e.g. just above and
+    below 0 degrees) still meet. Two fragments are joined when their directed
+    angles differ by at most max_angle, the second's midpoint lies within
+    max_offset of the first's line, and their projections on it overlap or
+    are at most max_gap apart; merged runs are the connected groups of such
+    pairs. Each run becomes one segment along the run's length-weighted
+    direction and offset, spanning the fragments' extent, and takes the
+    position of its first fragment; unmerged segments are returned unchanged.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    if len(lines) < 2:
+        return lines
+
+    pair_i, pair_j = build_parallel_pair_candidates(lines, min_length=0, max_angle=max_angle,
+                                                    max_gap=max_offset, max_extension=max_gap)
+    if len(pair_i) == 0:
+        return lines
+
+    x1, y1, x2, y2 = lines.astype(np.float64).T
+    lengths = np.hypot(x2 - x1, y2 - y1)
+    angles = np.arctan2(y2 - y1, x2 - x1)
+
+    # Exact tests in the frame of line i
+    angle_diff = np.abs(np.degrees(angles[pair_i] - angles[pair_j])) % 360.0
+    angle_diff = np.minimum(angle_diff, 360.0 - angle_diff)
+    ux, uy = np.cos(angles[pair_i]), np.sin(angles[pair_i])
+    mid_dx = ((x1 + x2)[pair_j] - (x1 + x2)[pair_i]) / 2
+    mid_dy = ((y1 + y2)[pair_j] - (y1 + y2)[pair_i]) / 2
+    offset = np.abs(mid_dy * ux - mid_dx * uy)
+    t1 = (x1[pair_j] - x1[pair_i]) * ux + (y1[pair_j] - y1[pair_i]) * uy
+    t2 = (x2[pair_j] - x1[pair_i]) * ux + (y2[pair_j] - y1[pair_i]) * uy
+    gap = np.maximum(np.minimum(t1, t2) - lengths[pair_i], -np.maximum(t1, t2))
+    joined = (angle_diff <= max_angle) & (offset <= max_offset) & (gap <= max_gap)
+
+    graph = coo_matrix((np.ones(np.count_nonzero(joined)), (pair_i[joined], pair_j[joined])),
+                       shape=(len(lines), len(lines)))
+    _, run_ids = connected_components(graph, directed=False)
+
+    run_sizes = np.bincount(run_ids)
+    members = np.flatnonzero(run_sizes[run_ids] > 1)
+    if len(members) == 0:
+        return lines
+
+    runs, inverse = np.unique(run_ids[members], return_inverse=True)
+    weight = lengths[members]
+    dir_x = np.bincount(inverse, weight * np.cos(angles[members]))
+    dir_y = np.bincount(inverse, weight * np.sin(angles[members]))
+    norm = np.hypot(dir_x, dir_y)
+    dir_x, dir_y = dir_x / norm, dir_y / norm
+
+    mx, my = dir_x[inverse], dir_y[inverse]
+    run_offset = (np.bincount(inverse, weight * ((y1 + y2)[members] / 2 * mx - (x1 + x2)[members] / 2 * my))
+                  / np.bincount(inverse, weight))
+    t1 = x1[members] * mx + y1[members] * my
+    t2 = x2[members] * mx + y2[members] * my
+    t_start = np.full(len(runs), np.inf)
+    t_end = np.full(len(runs), -np.inf)
+    np.minimum.at(t_start, inverse, np.minimum(t1, t2))
+    np.maximum.at(t_end, inverse, np.maximum(t1, t2))
+
+    base_x, base_y = -run_offset * dir_y, run_offset * dir_x
+    merged = np.stack([base_x + t_start * dir_x, base_y + t_start * dir_y,
+                       base_x + t_end * dir_x, base_y + t_end * dir_y], axis=1)
+
+    first_member = np.full(len(runs), len(lines))
+    np.minimum.at(first_member, inverse, members)
+    result = lines.copy()
+    result[first_member] = merged
+    keep = np.ones(len(lines), dtype=bool)
+    keep[members] = False
+    keep[first_member] = True
+    return result[keep]
+
+def select_pairs_greedy(pair_i, pair_j, score, processes=1):
+    """
+    Greedy selection: for each line in index order take its best-scoring
+    unused partner. Ties keep the lowest partner index, as the pairwise scan
+    did. Returns the indices of the chosen candidates, ordered by line.
+    """
+    order = np.lexsort((pair_j, -score, pair_i))
+    pair_i, pair_j = pair_i[order], pair_j[order]
 
-    # Find parallel pairs
-    pairs = []
+    chosen = []
     used = set()
 
-    for i, line1 in enumerate(lines):
+    group_starts = np.flatnonzero(np.r_[True, pair_i[1:] != pair_i[:-1]]) if len(pair_i) else []
+    group_ends = list(group_starts[1:]) + [len(pair_i)]
+
+    for start, end in zip(group_starts, group_ends):
+        i = int(pair_i[start])
         if i in used:
             continue
 
-        angle1 = line_angle(line1)
-        length1 = line_length(line1)
+        for k in range(start, end):
+            j = int(pair_j[k])
+            if j in used:
+                continue
+            chosen.append(order[k])
+            used.add(i)
+            used.add(j)
+            break
 
-        if length1 < 20:  # Too short
-            continue
+    return np.asarray(chosen, dtype=np.intp)
 
-        best_match = None
-        best_score = 0
+MATCHING_POOL_MIN_EDGES = 20000  # Smaller candidate graphs are matched in-process
 
-        for j, line2 in enumerate(lines):
-            if j <= i or j in used:
-                continue
+def max_weight_pairs(pair_i, pair_j, score):
+    """Indices of the candidates in a maximum-weight matching of one candidate graph."""
+    import networkx as nx
 
-            angle2 = line_angle(line2)
-            length2 = line_length(line2)
+    graph = nx.Graph()
+    graph.add_weighted_edges_from(zip(pair_i.tolist(), pair_j.tolist(), score.tolist()))
+    edge_index = {(i, j): k for k, (i, j) in enumerate(zip(pair_i.tolist(), pair_j.tolist()))}
+    return np.array(sorted(edge_index[min(u, v), max(u, v)] for u, v in nx.max_weight_matching(graph)),
+                    dtype=np.intp)
 
-            if length2 < 20:
-                continue
+def max_weight_pairs_batch(components):
+    return [max_weight_pairs(*component) for component in components]
 
-            # Check parallelism
-            angle_diff = abs(angle1 - angle2)
-            if angle_diff > 180:
-                angle_diff = 360 - angle_diff
+def select_pairs_matching(pair_i, pair_j, score, processes=1):
+    """
+    Order-independent selection: the set of pairs with the largest total
+    score, no line used twice. The candidate graph splits into connected
+    components (lines that could compete for a partner); a component with
+    one candidate takes it, larger ones are solved with networkx's
+    maximum-weight matching. With processes > 1 (None = CPU count) and at
+    least MATCHING_POOL_MIN_EDGES candidates in larger components, those are
+    batched by size over a process pool. Returns candidate indices ordered by line.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    if len(pair_i) == 0:
+        return np.empty(0, dtype=np.intp)
+
+    n_lines = int(max(pair_i.max(), pair_j.max())) + 1
+    graph = coo_matrix((np.ones(len(pair_i)), (pair_i, pair_j)), shape=(n_lines, n_lines))
+    _, labels = connected_components(graph, directed=False)
+
+    # Candidates grouped by component
+    component = labels[pair_i]
+    order = np.argsort(component, kind='stable')
+    starts = np.flatnonzero(np.r_[True, component[order][1:] != component[order][:-1]])
+    groups = np.split(order, starts[1:])
+
+    chosen = [group for group in groups if len(group) == 1]
+    contested = [group for group in groups if len(group) > 1]
+    log(f"  -> {len(chosen)} uncontested pairs, {len(contested)} components to match")
+
+    components = [(pair_i[group], pair_j[group], score[group]) for group in contested]
+    contested_edges = sum(len(group) for group in contested)
+    if processes != 1 and len(contested) > 1 and contested_edges >= MATCHING_POOL_MIN_EDGES:
+        workers = processes or os.cpu_count() or 1
+        batches = [[] for _ in range(workers)]
+        batch_edges = [0] * workers
+        batch_groups = [[] for _ in range(workers)]
+        # Largest components first, each to the least loaded batch
+        for k in sorted(range(len(contested)), key=lambda k: -len(contested[k])):
+            target = int(np.argmin(batch_edges))
+            batches[target].append(components[k])
+            batch_groups[target].append(contested[k])
+            batch_edges[target] += len(contested[k])
+        # Spawned: this runs in the --threads pool next to Path A
+        with spawn_process_pool(workers) as pool:
+            results = pool.map(max_weight_pairs_batch, batches)
+            for groups_in_batch, matched in zip(batch_groups, results):
+                chosen.extend(group[local] for group, local in zip(groups_in_batch, matched))
+    else:
+        chosen.extend(group[max_weight_pairs(*comp)] for group, comp in zip(contested, components))
 
-            if angle_diff > 5:  # Not parallel enough
-                continue
+    chosen = np.concatenate(chosen)
+    return chosen[np.lexsort((pair_j[chosen], pair_i[chosen]))]
 
-            # Check distance (wall thickness)
-            dist = perpendicular_distance(line1, line2)
-            if dist < 4 or dist > 15:  # Outside typical wall thickness range
-                continue
+# Pair selection engines for Path B step B.3 (--pairing). Each takes the
+# candidate pairs that pass the pairing tests and their scores, and returns
+# the indices of the chosen candidates.
+PAIRING_ENGINES = {
+    'greedy': select_pairs_greedy,
+    'matching': select_pairs_matching,
+}
 
-            # Check overlap in parallel direction
-            overlap = lines_overlap_parallel(line1, line2)
-            if overlap < 0.5:  # Less than 50% overlap
-                continue
+def detect_hollow_walls_parallel(binary_img, width, height, scale=1.0, segments='lsd', **pairing_options):
+    """
+    Path B: Detect hollow/double-line walls using edge detection and parallel line pairing.
+    segments selects the segment source (see SEGMENT_SOURCES); pairing_options
+    go to pair_parallel_segments.
+    scale < 1 means a reduced-resolution image; segments are scaled up so
+    pairing runs with its full-resolution pixel parameters.
+    Returns a WallSet of wall centerlines in 0-100 coordinates.
+    """
+    log("Path B: Parallel line detection for hollow walls...")
 
-            # Score this pairing
-            score = overlap * min(length1, length2) / (1 + abs(dist - 8))  # Prefer ~8px gap
+    # B.1 + B.2: Edges and line segments
+    lines = detect_segments(binary_img, segments)
+    return pair_parallel_segments(lines, width, height, scale, **pairing_options)
 
-            if score > best_score:
-                best_score = score
-                best_match = (j, line2, dist)
+def pair_parallel_segments(lines, width, height, scale=1.0, merge_segments=False, pairing='greedy',
+                           pairing_processes=1):
+    """
+    Path B steps B.3-B.4: pair parallel segments and return the pairs'
+    centerlines as a WallSet in 0-100 coordinates (page size width x height).
+    merge_segments first joins collinear fragments (merge_collinear_segments).
+    pairing picks the selection engine (see PAIRING_ENGINES); the matching
+    engine may spread large plans over pairing_processes worker processes.
+    """
+    if pairing not in PAIRING_ENGINES:
+        raise ValueError(f"Unknown pairing engine: {pairing} (choose from {', '.join(PAIRING_ENGINES)})")
+    if scale != 1.0:
+        lines = lines / np.float32(scale)
+    width, height = width / scale, height / scale
 
-        if best_match:
-            j, line2, dist = best_match
-            pairs.append((line1, line2, dist))
-            used.add(i)
-            used.add(j)
+    if len(lines) == 0:
+        log("  -> No line segments detected")
+        return WallSet.empty()
 
-    log(f"  -> Found {len(pairs)} parallel line pairs")
+    log(f"  -> {len(lines)} line segments")
 
-    # B.4: Calculate Centerlines
-    log("  B.4: Computing centerlines of paired walls...")
-    vectors = []
+    if merge_segments:
+        with stage("merge_segments"):
+            lines = merge_collinear_segments(lines)
+        log(f"  -> {len(lines)} segments after merging collinear fragments")
 
-    for line1, line2, gap in pairs:
-        x1, y1, x2, y2 = line1
-        x3, y3, x4, y4 = line2
+    # B.3: Parallel Line Pairing
+    log("  B.3: Pairing parallel lines...")
+
+    with stage("pairing"):
+        # Candidates from the orientation/offset index, scored in one batched pass
+        pair_i, pair_j = build_parallel_pair_candidates(lines)
+        log(f"  -> Index produced {len(pair_i)} candidate pairs")
+
+        angle_diff, gap, overlap, score = score_parallel_pairs(lines, pair_i, pair_j)
+
+        passes = ((angle_diff <= 5) &            # Parallel enough
+                  (gap >= 4) & (gap <= 15) &     # Typical wall thickness range
+                  (overlap >= 0.5) &             # At least 50% overlap
+                  (score > 0))
+        pair_i, pair_j, gap, score = pair_i[passes], pair_j[passes], gap[passes], score[passes]
+
+        chosen = PAIRING_ENGINES[pairing](pair_i, pair_j, score, processes=pairing_processes)
+        paired_i, paired_j, paired_gap = pair_i[chosen], pair_j[chosen], gap[chosen]
 
-        # Centerline = average of the two lines
-        cx1, cy1 = (x1 + x3) / 2, (y1 + y3) / 2
-        cx2, cy2 = (x2 + x4) / 2, (y2 + y4) / 2
+    log(f"  -> Found {len(paired_i)} parallel line pairs")
+
+    # B.4: Calculate Centerlines
+    log("  B.4: Computing centerlines of paired walls...")
+    with stage("centerlines"):
+        # Centerline = average of the two lines, one (2, 2) polyline per pair
+        centers = (lines[paired_i].astype(np.float64) + lines[paired_j]).reshape(-1, 2, 2) / 2
+        length = np.linalg.norm(centers[:, 1] - centers[:, 0], axis=1)
 
         # Convert to percentage coordinates
-        coords = [
-            [round((cx1 / width) * 100.0, 3), round((cy1 / height) * 100.0, 3)],
-            [round((cx2 / width) * 100.0, 3), round((cy2 / height) * 100.0, 3)]
-        ]
-
-        # Calculate length
-        length = np.sqrt((cx2 - cx1)**2 + (cy2 - cy1)**2)
-        length_normalized = (length / width) * 100.0
-
-        vectors.append({
-            'coords': coords,
-            'source': 'parallel',
-            'thickness_px': round(gap, 2),
-            'length_normalized': round(length_normalized, 2),
-            'confidence': 0.7  # Single-method detection
-        })
-
-    log(f"  -> Path B generated {len(vectors)} hollow wall segments")
-    return vectors
+        coords = np.round(centers.reshape(-1, 2) / [width, height] * 100.0, 3)
+        walls = WallSet.from_polylines(coords, np.full(len(centers), 2), 'parallel',
+                                       np.round(np.asarray(paired_gap, dtype=np.float64), 2),
+                                       0.7,  # Single-method detection
+                                       np.round(length / width * 100.0, 2))
+
+    log(f"  -> Path B generated {len(walls)} hollow wall segments")
+    return walls
 
 # ============================================================================
 # PHASE 3: FUSION
 # ============================================================================
 
+def wall_envelopes(walls):
+    """Bounding boxes of wall centerlines as shapely polygons."""
+    bounds = walls.bounds()
+    return shapely.box(bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3])
+
+def query_wall_envelopes(query_walls, tree_walls, distance):
+    """
+    Find (query, tree) wall index pairs whose envelopes lie within distance of
+    each other, using an STRtree over the tree walls' envelopes.
+    Returns two index arrays sorted by query index, then tree index.
+    """
+    if not len(query_walls) or not len(tree_walls):
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    tree = STRtree(wall_envelopes(tree_walls))
+    query_bounds = query_walls.bounds()
+    search_boxes = shapely.box(query_bounds[:, 0] - distance, query_bounds[:, 1] - distance,
+                               query_bounds[:, 2] + distance, query_bounds[:, 3] + distance)
+
+    query_idx, tree_idx = tree.query(search_boxes)
+    order = np.lexsort((tree_idx, query_idx))
+    return query_idx[order], tree_idx[order]
+
 def fuse_wall_detections(ridge_walls, parallel_walls, width, height):
     """
     Fuse results from both detection paths, removing duplicates and boosting
@@ -420,11 +1239,8 @@ def fuse_wall_detections(ridge_walls, parallel_walls, width, height):
     """
     log("Phase 3: Fusing wall detections...")
 
-    def wall_distance(wall1, wall2):
+    def wall_distance(coords1, coords2):
         """Calculate Hausdorff distance between two wall centerlines."""
-        coords1 = np.array(wall1['coords'])
-        coords2 = np.array(wall2['coords'])
-
         # Sample points along each wall
         if len(coords1) < 2 or len(coords2) < 2:
             return float('inf')
@@ -436,142 +1252,636 @@ def fuse_wall_detections(ridge_walls, parallel_walls, width, height):
         return max(np.min(dists, axis=1).max(), np.min(dists, axis=0).max())
 
     # Find duplicates (walls detected by both methods)
-    duplicates = []
+    dup_ridge = []
+    dup_parallel = []
     threshold = 5.0  # percentage points (on 0-100 scale)
 
-    for i, r_wall in enumerate(ridge_walls):
-        for j, p_wall in enumerate(parallel_walls):
-            dist = wall_distance(r_wall, p_wall)
-            if dist < threshold:
-                duplicates.append((i, j, dist))
+    # Hausdorff distance < threshold implies the bounding boxes are within threshold
+    # of each other, so only pairs whose buffered envelopes intersect are checked.
+    ridge_hits, parallel_hits = query_wall_envelopes(ridge_walls, parallel_walls, threshold)
+    for i, j in zip(ridge_hits, parallel_hits):
+        dist = wall_distance(ridge_walls.wall_coords(i).astype(np.float64),
+                             parallel_walls.wall_coords(j).astype(np.float64))
+        if dist < threshold:
+            dup_ridge.append(i)
+            dup_parallel.append(j)
+
+    dup_ridge = np.asarray(dup_ridge, dtype=np.intp)
+    dup_parallel = np.asarray(dup_parallel, dtype=np.intp)
+    log(f"  -> Found {len(dup_ridge)} walls detected by both methods")
+
+    # Dual-confirmed walls keep the centerline with more points (more detail),
+    # preferring the ridge trace on ties
+    both = WallSet.concat([ridge_walls, parallel_walls])
+    use_ridge = ridge_walls.counts[dup_ridge] >= parallel_walls.counts[dup_parallel]
+    dual = both.take(np.where(use_ridge, dup_ridge, len(ridge_walls) + dup_parallel))
+    dual.source[:] = SOURCE_CODES['dual_confirmed']
+    dual.ids[:] = -1  # New walls, not either input
+    # Average thickness
+    dual.thickness = np.round((ridge_walls.thickness[dup_ridge].astype(np.float64) +
+                               parallel_walls.thickness[dup_parallel]) / 2, 2).astype(np.float32)
+    dual.length = np.maximum(ridge_walls.length[dup_ridge], parallel_walls.length[dup_parallel])
+    dual.confidence[:] = 0.95  # High confidence - both methods agree!
+
+    # Then the walls only one path found
+    ridge_only = np.ones(len(ridge_walls), dtype=bool)
+    ridge_only[dup_ridge] = False
+    parallel_only = np.ones(len(parallel_walls), dtype=bool)
+    parallel_only[dup_parallel] = False
+
+    fused_walls = WallSet.concat([dual, ridge_walls.take(ridge_only), parallel_walls.take(parallel_only)])
 
-    log(f"  -> Found {len(duplicates)} walls detected by both methods")
+    log(f"  -> Fused result: {len(fused_walls)} total walls")
+    log(f"     - Dual-confirmed: {len(dual)}")
+    log(f"     - Ridge-only: {int(ridge_only.sum())}")
+    log(f"     - Parallel-only: {int(parallel_only.sum())}")
 
-    # Create fused result
-    fused_walls = []
-    used_ridge = set()
-    used_parallel = set()
+    return fused_walls
 
-    # Process duplicates (dual-confirmed walls)
-    for r_idx, p_idx, dist in duplicates:
-        r_wall = ridge_walls[r_idx]
-        p_wall = parallel_walls[p_idx]
+# ============================================================================
+# PHASE 4: VALIDATION & POST-PROCESSING
+# ============================================================================
 
-        # Average the centerlines
-        r_coords = np.array(r_wall['coords'])
-        p_coords = np.array(p_wall['coords'])
+def validate_and_filter_walls(walls):
+    """
+    Final validation and filtering of detected walls.
+    """
+    log("Phase 4: Validation and filtering...")
 
-        # Use the longer one as base (more detail)
-        if len(r_coords) >= len(p_coords):
-            coords = r_wall['coords']
-        else:
-            coords = p_wall['coords']
+    # Calculate total lengths (in percentage units 0-100) for all walls at once
+    counts = walls.counts
+    lengths = polyline_lengths(walls.coords.astype(np.float64), counts)
 
-        # Average thickness
-        avg_thickness = (r_wall['thickness_px'] + p_wall['thickness_px']) / 2
+    # Skip if too few points.
+    # RELAXED: Filter by minimum length (0.5% of image diagonal ~= 20-30px on 4000px image)
+    keep = (counts >= 2) & (lengths >= 0.5)  # Drop very short segments only
 
-        fused_walls.append({
-            'coords': coords,
-            'source': 'dual_confirmed',
-            'thickness_px': round(avg_thickness, 2),
-            'length_normalized': max(r_wall['length_normalized'], p_wall['length_normalized']),
-            'confidence': 0.95  # High confidence - both methods agree!
-        })
+    # Check straightness (optional, for now just pass through)
+    # Could measure deviation from best-fit line here
 
-        used_ridge.add(r_idx)
-        used_parallel.add(p_idx)
+    filtered = walls.take(keep)
 
-    # Add unique ridge walls
-    for i, wall in enumerate(ridge_walls):
-        if i not in used_ridge:
-            fused_walls.append(wall)
+    log(f"  -> Kept {len(filtered)}/{len(walls)} walls after validation")
+    return filtered
 
-    # Add unique parallel walls
-    for i, wall in enumerate(parallel_walls):
-        if i not in used_parallel:
-            fused_walls.append(wall)
+# ============================================================================
+# TILED EXECUTION (LARGE PLANS)
+# ============================================================================
 
-    log(f"  -> Fused result: {len(fused_walls)} total walls")
-    log(f"     - Dual-confirmed: {len(duplicates)}")
-    log(f"     - Ridge-only: {len(ridge_walls) - len(used_ridge)}")
-    log(f"     - Parallel-only: {len(parallel_walls) - len(used_parallel)}")
+def plan_tiles(width, height, tile_size, overlap):
+    """
+    Split the image into a grid of core rectangles of at most tile_size, each
+    read with `overlap` pixels of context on every side (clipped to the image).
+    Returns a list of (core, window) boxes as (x0, y0, x1, y1).
+    """
+    cols = max(1, int(np.ceil(width / tile_size)))
+    rows = max(1, int(np.ceil(height / tile_size)))
+    xs = np.linspace(0, width, cols + 1).round().astype(int)
+    ys = np.linspace(0, height, rows + 1).round().astype(int)
+
+    tiles = []
+    for r in range(rows):
+        for c in range(cols):
+            core = (int(xs[c]), int(ys[r]), int(xs[c + 1]), int(ys[r + 1]))
+            window = (max(0, core[0] - overlap), max(0, core[1] - overlap),
+                      min(width, core[2] + overlap), min(height, core[3] + overlap))
+            tiles.append((core, window))
+    return tiles
+
+def clip_polyline(coords, box):
+    """
+    Clip a polyline to an axis-aligned box (x0, y0, x1, y1) segment by segment
+    (Liang-Barsky). Unlike a shapely intersection this never nodes the line, so
+    self-overlapping ridge traces stay in one piece. Returns a list of (K,2) arrays.
+    """
+    x0, y0, x1, y1 = box
+    parts = []
+    current = []
+
+    for (ax, ay), (bx, by) in zip(coords[:-1], coords[1:]):
+        dx, dy = bx - ax, by - ay
+        t_enter, t_exit = 0.0, 1.0
+        for p, q in ((-dx, ax - x0), (dx, x1 - ax), (-dy, ay - y0), (dy, y1 - ay)):
+            if p == 0:
+                if q < 0:
+                    t_enter, t_exit = 1.0, 0.0
+                continue
+            t = q / p
+            if p < 0:
+                t_enter = max(t_enter, t)
+            else:
+                t_exit = min(t_exit, t)
+
+        if t_enter > t_exit:
+            # Segment entirely outside: close the running piece
+            if len(current) > 1:
+                parts.append(np.array(current))
+            current = []
+            continue
 
-    return fused_walls
+        start = (ax + t_enter * dx, ay + t_enter * dy)
+        end = (ax + t_exit * dx, ay + t_exit * dy)
+        if not current or t_enter > 0:
+            if len(current) > 1:
+                parts.append(np.array(current))
+            current = [start]
+        current.append(end)
+        if t_exit < 1.0:
+            parts.append(np.array(current))
+            current = []
+
+    if len(current) > 1:
+        parts.append(np.array(current))
+    return [part for part in parts if np.any(part[0] != part[-1]) or len(part) > 2]
+
+def process_tile(tile_img, core, window, ridge_options=None, scale=1.0, parallel_options=None, cache=None):
+    """
+    Run preprocessing and both detection paths on one tile (in a worker process).
+    Walls are returned as a WallSet in full-image pixel coordinates, clipped to
+    the tile's core so that each stretch of wall is owned by exactly one tile,
+    together with the tile's degraded-output reasons (see mark_degraded).
+    cache is the parent's (cache dir, max bytes, reads enabled), or None when
+    caching is off; spawned workers inherit no module state.
+    """
+    global _active_profiler, _active_cache, _cache_reads
+    _active_profiler = None  # Profiling stays in the parent process
+    if cache is None:
+        _active_cache = None
+    else:
+        root, max_bytes, _cache_reads = cache
+        if _active_cache is None or _active_cache.root != root:
+            _active_cache = ResultCache(root, max_bytes)
+    del _degraded[:]  # Pool workers are reused across tiles
+    walls = detect_window_walls(tile_img, core, window, ridge_options, scale, parallel_options)
+    return walls, list(_degraded)
+
+def detect_window_walls(tile_img, core, window, ridge_options=None, scale=1.0, parallel_options=None):
+    """
+    Preprocessing and both detection paths on the image crop at window,
+    returning walls in full-image pixel coordinates clipped to core.
+    parallel_options may also hold manhattan=True (see --manhattan).
+    """
+    tile_h, tile_w = tile_img.shape
+    parallel_options = dict(parallel_options or {})
+    detect_hollow = (detect_hollow_walls_manhattan if parallel_options.pop('manhattan', False)
+                     else detect_hollow_walls_parallel)
+    cleaned = cached_array("cleaned_binary", tile_img, preprocess_image, tile_img, 1, scale)
+    detected = WallSet.concat([detect_filled_walls_ridge(cleaned, tile_w, tile_h, scale=scale, **(ridge_options or {})),
+                               detect_hollow(cleaned, tile_w, tile_h, scale, **parallel_options)])
+
+    coords = detected.coords.astype(np.float64) / 100.0 * [tile_w, tile_h] + [window[0], window[1]]
+    parts = []
+    owners = []
+    for k in range(len(detected)):
+        for part in clip_polyline(coords[detected.offsets[k]:detected.offsets[k + 1]], core):
+            parts.append(part)
+            owners.append(k)
+
+    if not parts:
+        return WallSet.empty()
+    return WallSet.from_polylines(np.concatenate(parts), [len(part) for part in parts],
+                                  detected.source[owners], detected.thickness[owners],
+                                  detected.confidence[owners], detected.length[owners])
+
+def stitch_tile_walls(pieces, tiles, tolerance=4.0):
+    """
+    Join wall pieces that were cut at tile seams back into continuous polylines.
+
+    Endpoints lying on an interior seam are matched to the nearest endpoint of a
+    piece with the same source on the other side (within tolerance); matched
+    pieces are chained, meeting at the midpoint of the two endpoints.
+    Takes and returns a WallSet in full-image pixel coordinates.
+    """
+    from scipy.spatial import cKDTree
+
+    if not len(pieces):
+        return WallSet.empty()
+
+    seams_x = np.array(sorted({t[0][0] for t in tiles} - {0}), dtype=np.float64)
+    seams_y = np.array(sorted({t[0][1] for t in tiles} - {0}), dtype=np.float64)
+
+    # Endpoint e of piece k has id 2k + e (0 = start, 1 = end)
+    endpoints = np.stack([pieces.coords[pieces.offsets[:-1]], pieces.coords[pieces.offsets[1:] - 1]],
+                         axis=1).reshape(-1, 2).astype(np.float64)
+    on_seam = np.zeros(len(endpoints), dtype=bool)
+    if len(seams_x):
+        on_seam |= (np.abs(endpoints[:, :1] - seams_x) < 0.5).any(axis=1)
+    if len(seams_y):
+        on_seam |= (np.abs(endpoints[:, 1:] - seams_y) < 0.5).any(axis=1)
+
+    seam_ids = np.flatnonzero(on_seam)
+    partner = {}
+    if len(seam_ids):
+        points = endpoints[seam_ids]
+        candidates = []
+        for a, b in cKDTree(points).query_pairs(tolerance):
+            ia, ib = int(seam_ids[a]), int(seam_ids[b])
+            if ia // 2 == ib // 2 or pieces.source[ia // 2] != pieces.source[ib // 2]:
+                continue
+            candidates.append((np.linalg.norm(points[a] - points[b]), ia, ib))
+        for _, ia, ib in sorted(candidates):
+            if ia not in partner and ib not in partner:
+                partner[ia] = ib
+                partner[ib] = ia
+
+    chains = []
+    visited = set()
+
+    def walk(k, entry_end):
+        """Follow the chain starting at piece k entered through entry_end."""
+        chain = []
+        while k not in visited:
+            visited.add(k)
+            chain.append((k, entry_end))
+            exit_id = 2 * k + (1 - entry_end)
+            if exit_id not in partner:
+                break
+            next_id = partner[exit_id]
+            k, entry_end = next_id // 2, next_id % 2
+        return chain
+
+    # Open chains first (start at a free end), then any closed loops
+    starts = [(k, e) for k in range(len(pieces)) for e in (0, 1) if 2 * k + e not in partner]
+    starts += [(k, 0) for k in range(len(pieces))]
+    for k, e in starts:
+        if k not in visited:
+            chains.append(walk(k, e))
+
+    is_single = np.array([len(chain) == 1 for chain in chains])
+    single = np.array([chain[0][0] for chain in chains if len(chain) == 1], dtype=np.intp)
+    merged = [chain for chain in chains if len(chain) > 1]
+    if not merged:
+        return pieces.take(single)
+
+    joined = []
+    first = []
+    thickness = []
+    for chain in merged:
+        parts = [pieces.wall_coords(k).astype(np.float64)[::1 if e == 0 else -1] for k, e in chain]
+        coords = parts[0]
+        for part in parts[1:]:
+            joint = (coords[-1] + part[0]) / 2.0
+            coords = np.vstack([coords[:-1], joint, part[1:]])
+        joined.append(coords)
+
+        lengths = [np.linalg.norm(np.diff(part, axis=0), axis=1).sum() for part in parts]
+        first.append(chain[0][0])
+        thickness.append(np.average(pieces.thickness[[k for k, _ in chain]].astype(np.float64), weights=lengths))
+
+    # Simplify all merged chains in one batch
+    simplified, counts = simplify_polylines(np.concatenate(joined), [len(c) for c in joined], tolerance=2.0)
+    stitched = WallSet.from_polylines(simplified, counts, pieces.source[first], thickness,
+                                      pieces.confidence[first], pieces.length[first])
+    # Back into chain order
+    order = np.argsort(np.r_[np.flatnonzero(is_single), np.flatnonzero(~is_single)], kind='stable')
+    return WallSet.concat([pieces.take(single), stitched]).take(order)
+
+def detect_walls_tiled(img, tile_size, overlap, processes=None, ridge_options=None, scale=1.0,
+                       parallel_options=None):
+    """
+    Tiled Phase 1 + Phase 2: run preprocessing and both detection paths per tile
+    in a process pool, then stitch walls across tile seams. Returns
+    (ridge_walls, parallel_walls) in the same normalized form as the full-image paths.
+    """
+    height, width = img.shape
+    tiles = plan_tiles(width, height, tile_size, overlap)
+    log(f"Tiled mode: {len(tiles)} tiles of <= {tile_size}px (+{overlap}px overlap)")
+
+    cache = None
+    if _active_cache is not None:
+        cache = (_active_cache.root, _active_cache.max_bytes, _cache_reads)
+    with spawn_process_pool(processes) as pool:
+        jobs = [pool.submit(process_tile, img[w[1]:w[3], w[0]:w[2]].copy(), core, w, ridge_options, scale,
+                            parallel_options, cache)
+                for core, w in tiles]
+        results = [job.result() for job in jobs]
+    pieces = WallSet.concat([walls for walls, _ in results])
+    for reason in dict.fromkeys(reason for _, reasons in results for reason in reasons):
+        mark_degraded(reason)
+
+    with stage("stitch"):
+        walls = stitch_tile_walls(pieces, tiles)
+    log(f"  -> Stitched {len(pieces)} tile pieces into {len(walls)} walls")
+
+    ridge_walls, parallel_walls = normalize_pixel_walls(walls, width, height)
+    log(f"  -> Tiled detection: {len(ridge_walls)} ridge, {len(parallel_walls)} parallel walls")
+    return ridge_walls, parallel_walls
+
+def normalize_pixel_walls(walls, width, height):
+    """
+    Convert a WallSet in full-image pixel coordinates to 0-100 coordinates,
+    dropping walls left with a single point. Returns (ridge_walls,
+    parallel_walls) in the same form as the full-image paths.
+    """
+    coords_px = walls.coords.astype(np.float64)
+    normalized = np.round(coords_px / [width, height] * 100.0, 3)
+    counts = walls.counts
+    ridge = walls.source == SOURCE_CODES['ridge']
+
+    # Path A measures length in normalized coordinates, Path B pixel length
+    # relative to image width
+    lengths = np.where(ridge, polyline_lengths(normalized, counts),
+                       polyline_lengths(coords_px, counts) / width * 100.0)
+    walls = WallSet(normalized, walls.offsets, walls.source, np.round(walls.thickness.astype(np.float64), 2),
+                    walls.confidence, np.round(lengths, 2))
+
+    keep = counts >= 2
+    return walls.take(keep & ridge), walls.take(keep & ~ridge)
 
 # ============================================================================
-# PHASE 4: VALIDATION & POST-PROCESSING
+# PYRAMID (COARSE-TO-FINE) DETECTION
 # ============================================================================
 
-def validate_and_filter_walls(walls):
+PYRAMID_FACTOR = 4   # Coarse level is 1/4 scale
+PYRAMID_MARGIN = 4   # Coarse cells (16 px) of context kept around wall pixels
+# ROI origins on multiples of 20 px keep LSD's internal 0.8x resampling grid
+# (and the 4 px coarse cells) aligned with the full image's
+PYRAMID_ALIGN = 20
+# Pyramid walls are not bit-identical to a full-resolution run. At least this
+# share of each run's centerline length lies within 1 px of the other's; the
+# rest are a few Path B walls that LSD finds slightly differently on a crop.
+PYRAMID_AGREEMENT = 0.99
+
+def coarse_image(img, factor=PYRAMID_FACTOR):
+    """img shrunk to 1/factor by area averaging, zero-padded to whole cells."""
+    height, width = img.shape
+    cells_y, cells_x = -(-height // factor), -(-width // factor)
+    padded = cv2.copyMakeBorder(img, 0, cells_y * factor - height, 0, cells_x * factor - width,
+                                cv2.BORDER_CONSTANT, value=0)
+    return cv2.resize(padded, (cells_x, cells_y), interpolation=cv2.INTER_AREA)
+
+def plan_pyramid_rois(cleaned, factor=PYRAMID_FACTOR, margin=PYRAMID_MARGIN):
     """
-    Final validation and filtering of detected walls.
+    Coarse pass: shrink the cleaned binary to 1/factor (a cell is set if any
+    of its pixels is), dilate by margin cells and split into connected regions.
+    Every connected wall structure lies wholly inside one region.
+    Returns (box, mask) per region: box = (x0, y0, x1, y1) in full-resolution
+    pixels and mask = the region's pixels within the box.
     """
-    log("Phase 4: Validation and filtering...")
+    coarse = (coarse_image(cleaned, factor) > 0).astype(np.uint8)
+    return coarse_rois(coarse, cleaned.shape, factor, margin)
 
-    filtered = []
+def coarse_rois(coarse, shape, factor=PYRAMID_FACTOR, margin=PYRAMID_MARGIN):
+    """
+    Full-resolution (box, mask) regions for the set cells of a 1/factor
+    uint8 mask, dilated by margin cells (see plan_pyramid_rois).
+    """
+    height, width = shape
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2 * margin + 1, 2 * margin + 1))
+    regions = cv2.dilate(coarse, kernel)
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(regions, connectivity=8)
+
+    align = PYRAMID_ALIGN // factor  # in cells
+    rois = []
+    for k in range(1, num_labels):
+        cx, cy, cw, ch = stats[k, :4]
+        cx0, cy0 = cx // align * align, cy // align * align
+        cells = labels[cy0:cy + ch, cx0:cx + cw] == k
+        x0, y0 = int(cx0 * factor), int(cy0 * factor)
+        x1, y1 = min(width, int((cx + cw) * factor)), min(height, int((cy + ch) * factor))
+        mask = np.repeat(np.repeat(cells, factor, axis=0), factor, axis=1)[:y1 - y0, :x1 - x0]
+        rois.append(((x0, y0, x1, y1), mask))
+    return rois
+
+def roi_image(cleaned, box, mask):
+    """The cleaned binary inside box, with pixels of other regions cleared."""
+    x0, y0, x1, y1 = box
+    return np.where(mask, cleaned[y0:y1, x0:x1], 0).astype(cleaned.dtype)
+
+def detect_filled_walls_pyramid(cleaned, rois, width, height, scale=1.0, **ridge_options):
+    """Path A on each pyramid ROI at full resolution."""
+    log(f"Path A (pyramid): {len(rois)} regions")
+    return WallSet.concat([
+        detect_filled_walls_ridge(roi_image(cleaned, box, mask), width, height, scale=scale,
+                                  origin=box[:2], **ridge_options)
+        for box, mask in rois])
+
+def detect_hollow_walls_pyramid(cleaned, rois, width, height, scale=1.0, segments='lsd', **pairing_options):
+    """
+    Path B with line segments detected per pyramid ROI at full resolution and
+    paired over the whole page. LSD's minimum region size shrinks with the
+    image it sees, so ROIs also yield some very short segments the full page
+    would not; they are far below wall length and never pair. Its detection
+    thresholds also depend on the image size, so a few segments differ
+    slightly from a full-page run (see PYRAMID_AGREEMENT).
+    """
+    log(f"Path B (pyramid): {len(rois)} regions")
+    return pair_parallel_segments(detect_roi_segments(cleaned, rois, segments), width, height, scale,
+                                  **pairing_options)
+
+def detect_roi_segments(cleaned, rois, segments='lsd'):
+    """Segment detection on each ROI crop; segments are returned in page pixels."""
+    found = [np.empty((0, 4), dtype=np.float32)]
+    for box, mask in rois:
+        lines = detect_segments(roi_image(cleaned, box, mask), segments)
+        found.append(lines + np.array([box[0], box[1], box[0], box[1]], dtype=np.float32))
+    return np.concatenate(found)
 
-    for wall in walls:
-        coords = np.array(wall['coords'])
+# ============================================================================
+# PATH B: MANHATTAN FAST PATH (AXIS-ALIGNED WALLS)
+# ============================================================================
 
-        # Skip if too few points
-        if len(coords) < 2:
-            continue
+MANHATTAN_TOLERANCE = 3.0   # Degrees from 0/90 that still count as axis-aligned
+MANHATTAN_MIN_FRACTION = 0.5  # Share of gradient energy that must be axis-aligned
+MANHATTAN_MIN_RUN = 20      # Shortest edge run kept (pairing ignores shorter lines)
 
-        # Calculate total length (in percentage units 0-100)
-        length = sum(np.linalg.norm(coords[i] - coords[i-1]) for i in range(1, len(coords)))
+def axis_deviation(angles):
+    """Angular distance in degrees from the nearest multiple of 90."""
+    return np.abs((angles + 45.0) % 90.0 - 45.0)
 
-        # RELAXED: Filter by minimum length (0.5% of image diagonal ~= 20-30px on 4000px image)
-        if length < 0.5:  # Very short segments only
-            continue
+def gradient_orientations(cleaned, factor=PYRAMID_FACTOR):
+    """
+    Sobel gradient of the 1/factor coarse image. Returns (magnitude,
+    axis deviation in degrees) arrays at coarse resolution.
+    """
+    coarse = coarse_image(cleaned, factor)
+    gx = cv2.Sobel(coarse, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(coarse, cv2.CV_32F, 0, 1, ksize=3)
+    return cv2.magnitude(gx, gy), axis_deviation(cv2.phase(gx, gy, angleInDegrees=True))
 
-        # Check straightness (optional, for now just pass through)
-        # Could measure deviation from best-fit line here
+def chain_edge_runs(rows, x0, x1, width):
+    """
+    Join edge runs into chains across 1-pixel jogs: a run continues into a
+    run on the row above or below that starts where it ends (+-1 column).
+    Runs are (row, start, end) arrays in row-major order. Returns each
+    chain's first start and row and last end and row.
+    """
+    n = len(rows)
+    stride = width + 2
+    keys = rows * stride + x0  # Sorted, as runs come in row-major order
+    prev = np.full(n, -1, dtype=np.int64)
+    for d_row in (1, -1):
+        for d_col in (0, -1, 1):
+            target = (rows + d_row) * stride + x1 + d_col
+            pos = np.minimum(np.searchsorted(keys, target), n - 1)
+            hit = (keys[pos] == target) & (prev[pos] < 0)
+            # A run continues at most one predecessor: the first to claim it
+            succ, first = np.unique(pos[hit], return_index=True)
+            prev[succ] = np.flatnonzero(hit)[first]
+
+    # Pointer jumping to each chain's head (x only grows along a chain, so no cycles)
+    head = np.where(prev >= 0, prev, np.arange(n))
+    while True:
+        jumped = head[head]
+        if np.array_equal(jumped, head):
+            break
+        head = jumped
+
+    order = np.lexsort((x0, head))
+    group_starts = np.flatnonzero(np.r_[True, head[order][1:] != head[order][:-1]])
+    first, last = order[group_starts], order[np.r_[group_starts[1:], n] - 1]
+    return x0[first], rows[first], x1[last], rows[last]
+
+def axis_edge_runs(binary, min_length, tolerance=MANHATTAN_TOLERANCE):
+    """
+    Horizontal edge segments of a 0/1 mask from run-length encoding its rows:
+    runs of pixels whose upper (or lower) neighbor is background, chained
+    across 1-pixel jogs and placed on the pixel boundary. Segments shorter
+    than min_length or more than tolerance degrees off horizontal are dropped.
+    Returns (N,4) float32 [x1, y1, x2, y2] rows.
+    """
+    height, width = binary.shape
+    above = np.zeros_like(binary)
+    above[1:] = binary[:-1]
+    below = np.zeros_like(binary)
+    below[:-1] = binary[1:]
+
+    segments = [np.empty((0, 4), dtype=np.float32)]
+    for edge, offset in ((binary > above, -0.5), (binary > below, 0.5)):
+        # With a zero column on both sides, changes alternate start, end per row
+        padded = cv2.copyMakeBorder(edge.view(np.uint8), 0, 0, 1, 1, cv2.BORDER_CONSTANT, value=0)
+        changes = np.flatnonzero(padded[:, 1:] != padded[:, :-1])
+        if not len(changes):
+            continue
+        starts, ends = changes[0::2], changes[1::2]
+        rows, x0, x1 = starts // (width + 1), starts % (width + 1), ends % (width + 1)
 
-        filtered.append(wall)
+        xa, ya, xb, yb = chain_edge_runs(rows, x0, x1, width)
+        lines = np.stack([xa - 0.5, ya + offset, xb - 0.5, yb + offset], axis=1).astype(np.float32)
+        keep = ((np.hypot(xb - xa, yb - ya) >= min_length) &
+                (axis_deviation(np.degrees(np.arctan2(yb - ya, xb - xa))) <= tolerance))
+        segments.append(lines[keep])
+    return np.concatenate(segments)
 
-    log(f"  -> Kept {len(filtered)}/{len(walls)} walls after validation")
-    return filtered
+def detect_hollow_walls_manhattan(binary_img, width, height, scale=1.0, segments='lsd', **pairing_options):
+    """
+    Path B for near-Manhattan plans. When most gradient energy of the coarse
+    image lies within MANHATTAN_TOLERANCE of the axes, horizontal and vertical
+    edge segments come from run-length encoding the rows and columns of the
+    cleaned mask; the segments engine (LSD by default) runs only in the
+    coarse regions with off-axis gradients, keeping its off-axis segments.
+    Both feed the usual pairing.
+    Other plans fall back to detect_hollow_walls_parallel.
+    """
+    log("Path B: Manhattan fast path...")
+    with stage("orientation"):
+        magnitude, deviation = gradient_orientations(binary_img)
+        edges = magnitude > 0
+        total = float(magnitude[edges].sum())
+        axis_fraction = float(magnitude[edges & (deviation <= MANHATTAN_TOLERANCE)].sum()) / max(total, 1e-9)
+    log(f"  -> {axis_fraction:.1%} of gradient energy is axis-aligned")
+    if axis_fraction < MANHATTAN_MIN_FRACTION:
+        log("  -> Not a Manhattan plan, using LSD")
+        return detect_hollow_walls_parallel(binary_img, width, height, scale, segments, **pairing_options)
+
+    with stage("axis_runs"):
+        binary = (binary_img > 0).astype(np.uint8)
+        min_length = scale_px(MANHATTAN_MIN_RUN, scale)
+        horizontal = axis_edge_runs(binary, min_length)
+        vertical = axis_edge_runs(cv2.transpose(binary), min_length)[:, [1, 0, 3, 2]]
+    log(f"  -> Run-length projections: {len(horizontal)} horizontal, {len(vertical)} vertical edges")
+
+    with stage("off_axis"):
+        # Cells with a clear off-axis gradient (diagonals, tilted strokes, arcs)
+        mean_magnitude = total / max(1, np.count_nonzero(edges))
+        off_axis = edges & (deviation > MANHATTAN_TOLERANCE) & (magnitude >= 0.5 * mean_magnitude)
+        rois = coarse_rois(off_axis.astype(np.uint8), binary_img.shape)
+        residue = detect_roi_segments(binary_img, rois, segments)
+        angles = np.degrees(np.arctan2(residue[:, 3] - residue[:, 1], residue[:, 2] - residue[:, 0]))
+        residue = residue[axis_deviation(angles) > MANHATTAN_TOLERANCE]
+    log(f"  -> {segments} on {len(rois)} off-axis regions: {len(residue)} off-axis segments")
+
+    return pair_parallel_segments(np.concatenate([horizontal, vertical, residue]), width, height, scale,
+                                  **pairing_options)
 
 # ============================================================================
-# MAIN PROCESSING PIPELINE
+# REGION OF INTEREST (LOCAL RE-VECTORIZATION)
 # ============================================================================
 
-def process_image(image_path):
-    log(f"Processing: {image_path}")
+ROI_MARGIN = 64  # Full-resolution context pixels read around the ROI
 
-    # 1. READ IMAGE
-    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        raise ValueError(f"Could not read image: {image_path}")
-
-    height, width = img.shape
-    log(f"Image Dimensions: {width}x{height}")
-
-    # PHASE 1: PREPROCESSING
-    cleaned_binary = preprocess_image(img)
+def parse_roi(value):
+    """
+    Parse an ROI given as "x,y,w,h" or a 4-item sequence of 0-100 page
+    coordinates. Returns a tuple of floats; raises ValueError if invalid.
+    """
+    parts = value.split(',') if isinstance(value, str) else list(value)
+    try:
+        x, y, w, h = (float(v) for v in parts)
+    except (TypeError, ValueError):
+        raise ValueError(f"roi must be x,y,w,h (0-100), got {value!r}")
+    if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > 100 or y + h > 100:
+        raise ValueError(f"roi must be a non-empty rectangle within 0-100, got {value!r}")
+    return x, y, w, h
+
+def roi_argument(value):
+    """argparse type for --roi: parse_roi, with its reason shown on rejection."""
+    try:
+        return parse_roi(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
 
-    # PHASE 2: DUAL-PATH DETECTION
-    ridge_walls = detect_filled_walls_ridge(cleaned_binary, width, height)
-    parallel_walls = detect_hollow_walls_parallel(cleaned_binary, width, height)
+def plan_roi(roi, width, height, margin):
+    """
+    Pixel boxes (x0, y0, x1, y1) for a 0-100 ROI: the exact (float) core
+    rectangle walls are clipped to, and the integer window read around it
+    with margin pixels of context.
+    """
+    x, y, w, h = roi
+    core = (x / 100.0 * width, y / 100.0 * height, (x + w) / 100.0 * width, (y + h) / 100.0 * height)
+    window = (max(0, int(np.floor(core[0])) - margin), max(0, int(np.floor(core[1])) - margin),
+              min(width, int(np.ceil(core[2])) + margin), min(height, int(np.ceil(core[3])) + margin))
+    return core, window
 
-    # PHASE 3: FUSION
-    fused_walls = fuse_wall_detections(ridge_walls, parallel_walls, width, height)
+def detect_walls_roi(img, core, window, ridge_options=None, scale=1.0, parallel_options=None):
+    """
+    Phase 1 + Phase 2 on the window around an ROI only, with walls clipped
+    to its core. Returns (ridge_walls, parallel_walls) in page 0-100 coordinates.
+    """
+    height, width = img.shape
+    log(f"ROI mode: core {core}, window {window}")
+    x0, y0, x1, y1 = window
+    walls = detect_window_walls(img[y0:y1, x0:x1], core, window, ridge_options, scale, parallel_options)
+    ridge_walls, parallel_walls = normalize_pixel_walls(walls, width, height)
+    log(f"  -> ROI detection: {len(ridge_walls)} ridge, {len(parallel_walls)} parallel walls")
+    return ridge_walls, parallel_walls
 
-    # PHASE 4: VALIDATION
-    final_walls = validate_and_filter_walls(fused_walls)
+# ============================================================================
+# SYMBOL DETECTION
+# ============================================================================
 
-    # SYMBOL DETECTION (keep existing logic)
+def detect_symbols(img, width, height, scale=1.0, origin=(0, 0)):
+    """
+    Detect circular light symbols on the raw grayscale image via HoughCircles.
+    Radii are reported in full-resolution pixels for any scale. origin is the
+    (x, y) pixel offset of img within a width x height page.
+    """
     log("Symbol detection (circular lights)...")
     detected_symbols = []
 
-    circles = cv2.HoughCircles(img, cv2.HOUGH_GRADIENT, dp=1, minDist=20,
-                               param1=50, param2=25, minRadius=5, maxRadius=40)
+    # Circles collect fewer votes at reduced resolution. Scaling the vote
+    # threshold by sqrt(scale) keeps symbol counts close to full resolution.
+    circles = cv2.HoughCircles(img, cv2.HOUGH_GRADIENT, dp=1, minDist=scale_px(20, scale),
+                               param1=50, param2=scale_px(25, np.sqrt(scale)),
+                               minRadius=scale_px(5, scale), maxRadius=scale_px(40, scale))
 
     if circles is not None:
         circles = np.uint16(np.around(circles))
+        if scale != 1.0:
+            circles[..., 2] = np.round(circles[..., 2] / scale)
         for i in circles[0, :]:
-            x_pct = (float(i[0]) / width) * 100.0
-            y_pct = (float(i[1]) / height) * 100.0
+            x_pct = ((float(i[0]) + origin[0]) / width) * 100.0
+            y_pct = ((float(i[1]) + origin[1]) / height) * 100.0
 
             detected_symbols.append({
                 "type": "LIGHT",
@@ -582,6 +1892,253 @@ def process_image(image_path):
             })
 
     log(f"Detected {len(detected_symbols)} potential symbols")
+    return detected_symbols
+
+# ============================================================================
+# MAIN PROCESSING PIPELINE
+# ============================================================================
+
+# --preview reduction -> imread flag; JPEGs are decoded at reduced size in the DCT domain
+PREVIEW_READ_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+def process_image(image_path, profile=False, threads=1, tile_size=0, tile_overlap=128, processes=None,
+                  ocr_strips=1, ridge_options=None, use_cache=True, cache_dir=DEFAULT_CACHE_DIR, cache_max_mb=DEFAULT_CACHE_MAX_MB,
+                  stream=None, preview=1, pyramid=False, roi=None, manhattan=False, parallel_options=None):
+    """
+    Run the full pipeline on one image and return the output dict.
+    With profile=True, per-stage timings are added to metadata.processing.timings
+    and emitted as JSON lines on stderr, and nothing is read from the cache so
+    every stage really runs. With threads > 1, symbol detection and
+    the two wall detection paths run concurrently on a thread pool. With a
+    tile_size smaller than the image, preprocessing and detection run per tile
+    in a process pool and walls are stitched across tile seams. With ocr_strips > 1,
+    OCR runs on overlapping page strips in a process pool. ridge_options are
+    keyword arguments for detect_filled_walls_ridge (e.g. thinning backend),
+    parallel_options those for Path B (e.g. segments engine).
+    With a ResultStream, progress records are written as each phase finishes.
+    preview = 2, 4 or 8 decodes the image at that fraction of full resolution
+    for a fast draft run (see run_pipeline). pyramid=True runs the wall
+    detectors only in regions found on a 1/4-scale pass (see plan_pyramid_rois).
+    roi = (x, y, w, h) in 0-100 coordinates re-vectorizes only that rectangle.
+    manhattan=True uses the axis-aligned fast path for Path B on plans that
+    are near-Manhattan (see detect_hollow_walls_manhattan).
+
+    Unless use_cache is False, the final JSON is cached by image content,
+    output-affecting parameters and processor version, and the expensive
+    intermediates are cached by the content of their input arrays.
+    """
+    global _active_profiler, _active_cache, _cache_reads
+    cache = ResultCache(cache_dir, cache_max_mb * 1024 * 1024) if use_cache else None
+    result_key = None
+    if cache:
+        if not os.path.exists(image_path):
+            raise ValueError(f"Could not read image: {image_path}")
+        params = {'tile_size': tile_size, 'tile_overlap': tile_overlap, 'ocr_strips': ocr_strips,
+                  'ridge_options': ridge_options or {}, 'parallel_options': parallel_options or {},
+                  'preview': preview, 'pyramid': pyramid,
+                  'roi': roi and parse_roi(roi), 'manhattan': manhattan}
+        result_key = cache.key("result", PROCESSOR_VERSION, CODE_FINGERPRINT, digest_file(image_path), params)
+        # Profiling runs always execute so the timings are real
+        cached = None if profile else cache.get_json(result_key)
+        if cached is not None:
+            log(f"Cache hit: {image_path}")
+            if stream:
+                stream.replay(cached)
+            return cached
+
+    profiler = StageProfiler().start() if profile else None
+    _active_profiler = profiler
+    _active_cache = cache
+    # Profiled runs recompute every intermediate too, so stage timings are real
+    _cache_reads = not profile
+    del _degraded[:]
+    try:
+        output_data = run_pipeline(image_path, threads=threads, tile_size=tile_size,
+                                   tile_overlap=tile_overlap, processes=processes, ocr_strips=ocr_strips,
+                                   ridge_options=ridge_options, stream=stream, preview=preview,
+                                   pyramid=pyramid, roi=roi, manhattan=manhattan,
+                                   parallel_options=parallel_options)
+    finally:
+        _active_profiler = None
+        _active_cache = None
+        _cache_reads = True
+        if profiler:
+            profiler.stop()
+
+    if cache and _degraded:
+        log(f"Not caching degraded result ({'; '.join(dict.fromkeys(_degraded))})")
+    elif cache:
+        cache.put_json(result_key, output_data)
+    if profiler:
+        output_data['metadata']['processing']['timings'] = profiler.records
+    if stream:
+        stream.finish(output_data)
+    return output_data
+
+def run_stage(name, fn, *args, **kwargs):
+    """Call fn(*args, **kwargs) inside a profiling stage."""
+    with stage(name):
+        return fn(*args, **kwargs)
+
+def submit_stage(executor, name, fn, *args, **kwargs):
+    """
+    Submit a pipeline stage to the executor, or run it inline when there is no
+    executor. Either way a Future is returned so callers join results uniformly.
+    """
+    if executor is not None:
+        return executor.submit(run_stage, name, fn, *args, **kwargs)
+
+    future = Future()
+    try:
+        future.set_result(run_stage(name, fn, *args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def run_pipeline(image_path, threads=1, tile_size=0, tile_overlap=128, processes=None, ocr_strips=1,
+                 ridge_options=None, stream=None, preview=1, pyramid=False, roi=None, manhattan=False,
+                 parallel_options=None):
+    """
+    Run all phases on one image and return the output dict. With preview > 1
+    the JPEG is decoded at 1/preview size (DCT-domain scaling) and every stage
+    runs on that image with its pixel parameters scaled to match. Coordinates
+    stay in the same 0-100 space and thicknesses/radii in full-resolution
+    pixels; width and height are those of the decoded image.
+    With pyramid=True (untiled runs only), a 1/4-scale pass of the cleaned
+    binary finds the regions that contain walls, and ridge detection and LSD
+    run at full resolution inside those regions only. Walls then match a
+    full-resolution run to within 1 px over PYRAMID_AGREEMENT of their length.
+    With an roi (x, y, w, h in 0-100 coordinates), preprocessing and detection
+    see only that rectangle plus ROI_MARGIN pixels of context, and walls and
+    symbols are clipped to the rectangle. Coordinates stay page coordinates,
+    so the result can replace the walls inside the rectangle of a full run.
+    manhattan=True replaces Canny + LSD in Path B with run-length projections
+    on near-Manhattan plans; tiled and ROI runs decide it per window.
+    """
+    log(f"Processing: {image_path}")
+    ridge_options = ridge_options or {}
+    parallel_options = parallel_options or {}
+    if preview not in PREVIEW_READ_FLAGS:
+        raise ValueError(f"preview must be one of {sorted(PREVIEW_READ_FLAGS)}")
+    scale = 1.0 / preview
+
+    # 1. READ IMAGE
+    with stage("read"):
+        img = cv2.imread(image_path, PREVIEW_READ_FLAGS[preview])
+    if img is None:
+        raise ValueError(f"Could not read image: {image_path}")
+
+    height, width = img.shape
+    log(f"Image Dimensions: {width}x{height}" + (f" (preview 1/{preview})" if preview > 1 else ""))
+    # Tile sizes are given in full-resolution pixels
+    work_tile_size, work_tile_overlap = scale_px(tile_size, scale, minimum=0), scale_px(tile_overlap, scale, minimum=0)
+    if stream:
+        stream.header(width, height)
+
+    tiled = bool(work_tile_size) and max(width, height) > work_tile_size
+    if roi:
+        roi = parse_roi(roi)
+        roi_core, roi_window = plan_roi(roi, width, height, scale_px(ROI_MARGIN, scale))
+        # The ROI is a single small window: no tiling or pyramid needed
+        tiled = pyramid = False
+    if pyramid and tiled:
+        log("Pyramid mode is ignored for tiled runs")
+        pyramid = False
+
+    # Independent passes go to a thread pool; most of their time is spent in
+    # OpenCV/skimage calls that release the GIL
+    executor = None
+    if threads > 1:
+        executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="vectorizer")
+        log(f"Concurrent mode: {threads} worker threads")
+
+    try:
+        # SYMBOL DETECTION (keep existing logic) - only needs the raw image
+        if roi:
+            def detect_roi_symbols():
+                x0, y0, x1, y1 = roi_window
+                symbols = detect_symbols(img[y0:y1, x0:x1], width, height, scale, origin=(x0, y0))
+                x, y, w, h = roi
+                return [s for s in symbols if x <= s['x'] <= x + w and y <= s['y'] <= y + h]
+
+            symbols_job = submit_stage(executor, "symbols", published(detect_roi_symbols, stream and stream.symbols))
+        else:
+            symbols_job = submit_stage(executor, "symbols", published(detect_symbols, stream and stream.symbols),
+                                       img, width, height, scale)
+
+        # ROI and tile windows pick their Path B detector themselves
+        window_parallel_options = {**parallel_options, 'manhattan': True} if manhattan else parallel_options
+        if roi:
+            # PHASES 1-2 on the ROI window only
+            with stage("roi"):
+                ridge_walls, parallel_walls = detect_walls_roi(img, roi_core, roi_window, ridge_options, scale,
+                                                               window_parallel_options)
+            if stream:
+                stream.publish('ridge', ridge_walls)
+                stream.publish('parallel', parallel_walls)
+        elif tiled:
+            # PHASES 1-2 per tile across processes, stitched at the seams
+            with stage("tiles"):
+                ridge_walls, parallel_walls = detect_walls_tiled(img, work_tile_size, work_tile_overlap, processes,
+                                                                 ridge_options, scale, window_parallel_options)
+            if stream:
+                stream.publish('ridge', ridge_walls)
+                stream.publish('parallel', parallel_walls)
+        else:
+            # PHASE 1: PREPROCESSING
+            with stage("preprocess"):
+                cleaned_binary = cached_array("cleaned_binary", img, partial(preprocess_image, processes=processes),
+                                              img, ocr_strips, scale)
+
+            # PHASE 2: DUAL-PATH DETECTION (both paths only read cleaned_binary)
+            if pyramid:
+                with stage("pyramid_rois"):
+                    rois = plan_pyramid_rois(cleaned_binary)
+                roi_pixels = sum((x1 - x0) * (y1 - y0) for (x0, y0, x1, y1), _ in rois)
+                log(f"Pyramid: {len(rois)} regions covering {roi_pixels / (width * height):.1%} of the page")
+                ridge_args = (detect_filled_walls_pyramid, cleaned_binary, rois)
+                parallel_args = (detect_hollow_walls_pyramid, cleaned_binary, rois)
+            else:
+                ridge_args = (detect_filled_walls_ridge, cleaned_binary)
+                parallel_args = (detect_hollow_walls_parallel, cleaned_binary)
+            if manhattan:
+                # Path B on the whole page: its LSD already runs only in off-axis regions
+                parallel_args = (detect_hollow_walls_manhattan, cleaned_binary)
+            path_b_options = parallel_options
+            if parallel_options.get('pairing') == 'matching':
+                # Large candidate graphs are matched across the worker processes
+                path_b_options = {'pairing_processes': processes, **parallel_options}
+            ridge_job = submit_stage(executor, "ridge",
+                                     published(ridge_args[0], stream and partial(stream.publish, 'ridge')),
+                                     *ridge_args[1:], width, height, scale=scale, **ridge_options)
+            parallel_job = submit_stage(executor, "parallel",
+                                        published(parallel_args[0], stream and partial(stream.publish, 'parallel')),
+                                        *parallel_args[1:], width, height, scale, **path_b_options)
+            ridge_walls = ridge_job.result()
+            parallel_walls = parallel_job.result()
+
+        # PHASE 3: FUSION
+        with stage("fusion"):
+            fused_walls = fuse_wall_detections(ridge_walls, parallel_walls, width, height)
+        if stream:
+            stream.publish('fusion', fused_walls)
+            stream.remove('fusion', WallSet.concat([ridge_walls, parallel_walls]), fused_walls)
+
+        # PHASE 4: VALIDATION
+        with stage("validation"):
+            final_walls = validate_and_filter_walls(fused_walls)
+        if stream:
+            stream.remove('validation', fused_walls, final_walls)
+
+        detected_symbols = symbols_job.result()
+    finally:
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
 
     # OUTPUT JSON (convert numpy types to native Python)
     def convert_to_native(obj):
@@ -605,38 +2162,352 @@ def process_image(image_path):
             "height": int(height),
             "processing": {
                 "method": "hybrid_ridge_parallel",
-                "version": "2.0"
+                "version": PROCESSOR_VERSION
             },
             "detection_stats": {
                 "path_a_ridge": len(ridge_walls),
                 "path_b_parallel": len(parallel_walls),
-                "dual_confirmed": len([w for w in final_walls if w.get('source') == 'dual_confirmed']),
-                "ridge_only": len([w for w in final_walls if w.get('source') == 'ridge']),
-                "parallel_only": len([w for w in final_walls if w.get('source') == 'parallel']),
+                "dual_confirmed": final_walls.count('dual_confirmed'),
+                "ridge_only": final_walls.count('ridge'),
+                "parallel_only": final_walls.count('parallel'),
                 "total_walls": len(final_walls)
             }
         },
-        "walls": [{'coords': [[float(p[0]), float(p[1])] for p in w['coords']],
-                   'source': w['source'],
-                   'thickness_px': float(w['thickness_px']),
-                   'confidence': float(w['confidence'])}
-                  for w in final_walls],
+        "walls": final_walls.to_records(),
         "detected_symbols": convert_to_native(detected_symbols)
     }
 
-    print(json.dumps(output_data))
+    if preview > 1:
+        output_data['metadata']['processing']['preview'] = {"reduction": int(preview)}
+
+    if roi:
+        output_data['metadata']['processing']['roi'] = {
+            "rect": list(roi),
+            "window_px": [int(v / scale) for v in roi_window]
+        }
+
+    if pyramid:
+        output_data['metadata']['processing']['pyramid'] = {
+            "factor": PYRAMID_FACTOR,
+            "regions": len(rois),
+            "area_fraction": round(roi_pixels / (width * height), 4)
+        }
+
+    if tiled:
+        output_data['metadata']['processing']['tiling'] = {
+            "tile_size": int(tile_size),
+            "tile_overlap": int(tile_overlap)
+        }
+
+    return output_data
+
+# ============================================================================
+# OUTPUT FORMATS
+# ============================================================================
+
+# json: one document on stdout. ndjson: streamed records (see ResultStream).
+# f32/u16: binary walls file plus JSON sidecar
+OUTPUT_FORMATS = ('json', 'ndjson') + tuple(COORD_FORMATS)
+
+class ResultStream:
+    """
+    Newline-delimited JSON progress records, written as the pipeline runs:
+
+        {"type": "header", "width": W, "height": H}
+        {"type": "wall", "phase": "ridge" | "parallel" | "fusion" | "final", "id": 3, "coords": ..., ...}
+        {"type": "remove", "phase": "fusion" | "validation", "ids": [...]}
+        {"type": "symbols", "symbols": [...]}
+        {"type": "stats", "metadata": {...}}
+
+    Walls get ids when first published; fusion adds dual-confirmed walls and
+    then removes the walls they replace, validation removes rejects. Applying
+    the records in order leaves exactly the walls of the JSON result. A cached
+    result is replayed as its final walls. Safe to call from pipeline threads.
+    """
+
+    def __init__(self, write):
+        self.write = write  # callable(record dict)
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def emit(self, record_type, **fields):
+        with self.lock:
+            self.write({'type': record_type, **fields})
+
+    def header(self, width, height):
+        self.emit('header', width=int(width), height=int(height))
+
+    def publish(self, phase, walls):
+        """Assign ids to walls that have none (in place) and emit them."""
+        with self.lock:
+            new = walls.ids < 0
+            walls.ids[new] = np.arange(self.next_id, self.next_id + np.count_nonzero(new))
+            self.next_id += int(np.count_nonzero(new))
+        for record in walls.take(new).to_records(with_ids=True):
+            self.emit('wall', phase=phase, **record)
+
+    def remove(self, phase, before, after):
+        """Emit the ids of walls in before that are gone from after."""
+        self.emit('remove', phase=phase, ids=np.setdiff1d(before.ids, after.ids).tolist())
+
+    def symbols(self, symbols):
+        self.emit('symbols', symbols=symbols)
+
+    def finish(self, output_data):
+        self.emit('stats', metadata=output_data['metadata'])
+
+    def replay(self, output_data):
+        """Stream a finished (cached) result."""
+        metadata = output_data['metadata']
+        self.header(metadata['width'], metadata['height'])
+        for wall_id, wall in enumerate(output_data['walls']):
+            self.emit('wall', phase='final', **wall, id=wall_id)
+        self.symbols(output_data['detected_symbols'])
+        self.finish(output_data)
+
+def ndjson_writer(stream):
+    """Record writer for ResultStream: one JSON document per line, flushed."""
+    def write(record):
+        stream.write(json.dumps(record) + "\n")
+        stream.flush()
+    return write
+
+def published(fn, publish):
+    """Wrap a pipeline stage so its result is passed to publish as soon as it returns."""
+    if publish is None:
+        return fn
+
+    def run(*args, **kwargs):
+        result = fn(*args, **kwargs)
+        publish(result)
+        return result
+    return run
+
+def write_binary_output(output_data, path, coord_format='f32'):
+    """
+    Write the walls of a process_image() result to path in the binary wall
+    format (see wallset.encode_binary), with the metadata, symbols and wall
+    layout in a JSON sidecar at path + '.json'. Returns the sidecar dict.
+    """
+    walls = WallSet.from_records(output_data['walls'])
+    data = encode_binary(walls, coord_format)
+    sidecar = {
+        'metadata': output_data['metadata'],
+        'detected_symbols': output_data['detected_symbols'],
+        'walls_binary': {
+            'path': os.path.abspath(path),
+            'format': coord_format,
+            'bytes': len(data),
+            'wall_count': len(walls),
+            'point_count': len(walls.coords),
+            'sources': list(SOURCES),
+        },
+    }
+
+    with open(path, 'wb') as f:
+        f.write(data)
+    with open(path + '.json', 'w') as f:
+        json.dump(sidecar, f)
+    return sidecar
+
+# ============================================================================
+# WORKER MODE
+# ============================================================================
+
+# "vectorize" request params and how they map onto process_image() arguments
+REQUEST_OPTIONS = {
+    'profile': ('profile', bool),
+    'threads': ('threads', int),
+    'tile_size': ('tile_size', int),
+    'tile_overlap': ('tile_overlap', int),
+    'processes': ('processes', int),
+    'ocr_strips': ('ocr_strips', int),
+    'ridge_options': ('ridge_options', dict),
+    'no_cache': ('use_cache', lambda value: not value),
+    'preview': ('preview', int),
+    'pyramid': ('pyramid', bool),
+    'roi': ('roi', parse_roi),
+    'manhattan': ('manhattan', bool),
+    'parallel_options': ('parallel_options', dict),
+}
+
+def handle_request(request, defaults=None, write_record=None):
+    """
+    Dispatch one JSON-RPC style request to the pipeline. defaults holds
+    process_image() arguments from the worker's command line; request params
+    override them. write_record receives ResultStream records for "ndjson" requests.
+    """
+    method = request.get('method')
+    params = request.get('params') or {}
+
+    if method == 'vectorize':
+        if 'input' not in params:
+            raise ValueError("vectorize requires params.input")
+        output_format = params.get('format') or 'json'
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown format: {output_format}")
+        if output_format in COORD_FORMATS and not params.get('output'):
+            raise ValueError(f"format {output_format} requires params.output")
+
+        options = dict(defaults or {})
+        for name, (argument, convert) in REQUEST_OPTIONS.items():
+            if params.get(name) is not None:
+                options[argument] = convert(params[name])
+        if output_format == 'ndjson':
+            options['stream'] = ResultStream(write_record)
+        result = process_image(params['input'], **options)
+
+        if output_format == 'json':
+            return result
+        if output_format == 'ndjson':
+            # Everything was already sent as stream records
+            return {'streamed': True}
+        # Only the sidecar goes back over the pipe; walls are in params.output
+        return write_binary_output(result, params['output'], output_format)
+    if method == 'ping':
+        return {'pong': True, 'version': PROCESSOR_VERSION}
+
+    raise ValueError(f"Unknown method: {method}")
+
+def write_stream_record(out, request_id, record):
+    out.write(json.dumps({'id': request_id, 'stream': record}) + "\n")
+    out.flush()
+
+def serve(stdin=None, stdout=None, defaults=None):
+    """
+    Long-lived worker: read one JSON request per line from stdin and write one
+    JSON response per line to stdout. Heavy modules are imported once at startup,
+    so each request only pays for the image work.
+
+    Request:  {"id": 1, "method": "vectorize", "params": {"input": "/path/img.jpg"}}
+    Response: {"id": 1, "result": {...}}  or  {"id": 1, "error": {"message": "..."}}
+
+    With params.format "f32" or "u16" the walls are written to params.output
+    in the binary wall format and the result is the JSON sidecar. With
+    "ndjson", ResultStream records arrive first as {"id": 1, "stream": {...}}
+    lines, followed by {"id": 1, "result": {"streamed": true}}.
+    """
+    stdin = stdin or sys.stdin
+    protocol_out = stdout or sys.stdout
+    # Anything a library prints must not corrupt the response stream
+    sys.stdout = sys.stderr
+
+    log("Worker ready")
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            write_record = partial(write_stream_record, protocol_out, request_id)
+            response = {'id': request_id, 'result': handle_request(request, defaults, write_record)}
+        except Exception as e:
+            error(str(e))
+            import traceback
+            traceback.print_exc(file=sys.stderr)
+            response = {'id': request_id, 'error': {'message': str(e)}}
+
+        protocol_out.write(json.dumps(response) + "\n")
+        protocol_out.flush()
+
+    log("Worker input closed, exiting")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Hybrid Floorplan Wall Vectorizer")
-    parser.add_argument("--input", required=True, help="Path to input image")
+    parser.add_argument("--input", help="Path to input image")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record per-stage timing/memory in metadata.processing.timings")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="Worker threads for concurrent symbol/ridge/parallel passes (1 = sequential)")
+    parser.add_argument("--tile-size", type=int, default=0,
+                        help="Process images larger than this many pixels as overlapping tiles (0 = off)")
+    parser.add_argument("--tile-overlap", type=int, default=128,
+                        help="Context pixels read around each tile")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Worker processes for tiled mode and --pairing matching (default: CPU count)")
+    parser.add_argument("--ocr-strips", type=int, default=1,
+                        help="Run OCR on this many overlapping horizontal strips in parallel")
+    parser.add_argument("--thinning", choices=sorted(THINNING_BACKENDS), default="skimage",
+                        help="Skeletonization backend for Path A ridge extraction")
+    parser.add_argument("--thinning-per-component", action="store_true",
+                        help="Thin each connected ridge component inside its own bounding box")
+    parser.add_argument("--segments", choices=sorted(SEGMENT_SOURCES), default="lsd",
+                        help="Line segment engine for Path B (fld needs opencv-contrib)")
+    parser.add_argument("--merge-segments", action="store_true",
+                        help="Join collinear segment fragments before Path B pairing")
+    parser.add_argument("--pairing", choices=sorted(PAIRING_ENGINES), default="greedy",
+                        help="Path B pair selection: greedy in segment order, or maximum-weight matching "
+                             "per connected component of the candidate graph")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the on-disk result/intermediate cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Cache directory (default: $VECTORIZER_CACHE_DIR or python-worker/.cache)")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_CACHE_MAX_MB,
+                        help="Evict least recently used cache entries beyond this size")
+    parser.add_argument("--preview", type=int, choices=sorted(PREVIEW_READ_FLAGS), default=1,
+                        help="Draft run on the image decoded at 1/2, 1/4 or 1/8 resolution (1 = full)")
+    parser.add_argument("--roi", type=roi_argument,
+                        help="Re-vectorize only the rectangle x,y,w,h (0-100 page coordinates); "
+                             "walls and symbols are clipped to it")
+    parser.add_argument("--manhattan", action="store_true",
+                        help="Path B fast path for axis-aligned plans: run-length projections instead of "
+                             "Canny + LSD, with LSD only for off-axis regions")
+    parser.add_argument("--pyramid", action="store_true",
+                        help="Find wall regions on a 1/4-scale pass and run ridge/LSD detection only there")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="json",
+                        help="json, ndjson (records streamed as each phase finishes), or binary walls "
+                             "with float32 (f32) or quantized uint16 (u16) coordinates")
+    parser.add_argument("--output",
+                        help="Write the result here instead of stdout (required for binary formats; "
+                             "the JSON sidecar goes to OUTPUT.json)")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run as a persistent worker reading line-delimited JSON requests on stdin")
 
     args = parser.parse_args()
 
+    if args.serve:
+        serve(defaults={'use_cache': not args.no_cache, 'cache_dir': args.cache_dir,
+                        'cache_max_mb': args.cache_max_mb})
+        sys.exit(0)
+
+    if not args.input:
+        parser.error("--input is required unless --serve is given")
+    if args.format in COORD_FORMATS and not args.output:
+        parser.error(f"--format {args.format} requires --output")
+
+    stream = None
+    if args.format == 'ndjson':
+        stream = ResultStream(ndjson_writer(open(args.output, 'w') if args.output else sys.stdout))
+
     try:
-        process_image(args.input)
+        result = process_image(args.input, profile=args.profile, threads=args.threads,
+                               tile_size=args.tile_size, tile_overlap=args.tile_overlap,
+                               processes=args.processes, ocr_strips=args.ocr_strips,
+                               ridge_options={'thinning': args.thinning,
+                                              'thinning_per_component': args.thinning_per_component},
+                               parallel_options={'segments': args.segments,
+                                                 'merge_segments': args.merge_segments,
+                                                 'pairing': args.pairing},
+                               use_cache=not args.no_cache,
+                               cache_dir=args.cache_dir, cache_max_mb=args.cache_max_mb,
+                               stream=stream, preview=args.preview, pyramid=args.pyramid,
+                               roi=args.roi, manhattan=args.manhattan)
+        # ndjson records were already written as the pipeline ran
+        if args.format in COORD_FORMATS:
+            write_binary_output(result, args.output, args.format)
+        elif args.format == 'json' and args.output:
+            with open(args.output, 'w') as f:
+                json.dump(result, f)
+        elif args.format == 'json':
+            print(json.dumps(result))
     except Exception as e:
         error(str(e))
         import traceback
         traceback.print_exc(file=sys.stderr)
+        if stream:
+            stream.emit('error', message=str(e))
         sys.exit(1)
@@ -0,0 +1,145 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# Writes between full directory scans. In between, the cache size is tracked
+# from this process's own writes; the rescan picks up other processes' writes.
+RESCAN_WRITES = 256
+
+
+def digest_bytes(data):
+    """Hex digest used for all cache keys."""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+def digest_file(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def digest_array(arr):
+    """Content hash of an array, including its shape and dtype."""
+    arr = np.ascontiguousarray(arr)
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{arr.dtype.str}{arr.shape}".encode())
+    h.update(memoryview(arr).cast('B'))
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache for vectorizer results and intermediates.
+
+    Final results are stored as JSON, arrays as compressed .npz. Entries are
+    touched on every hit, and the least recently used ones are evicted once
+    the directory grows past max_bytes. The size is tracked incrementally, so
+    a write only walks the directory when the tracked size crosses max_bytes
+    or every RESCAN_WRITES writes.
+    """
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size = None  # Approximate bytes on disk; None until the first scan
+        self._writes = 0   # Writes since the last scan
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, *parts):
+        """Build a key from JSON-serializable parts (names, digests, parameters)."""
+        return digest_bytes(json.dumps(parts, sort_keys=True, default=str).encode())
+
+    def _path(self, key, ext):
+        return os.path.join(self.root, key[:2], f"{key}{ext}")
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # LRU: mark as recently used
+            return data
+        except OSError:
+            return None
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so concurrent readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._writes += 1
+        if self._size is None or self._writes >= RESCAN_WRITES:
+            self.evict()
+        else:
+            self._size += len(data)  # Overwrites are counted twice; the next scan corrects it
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def get_json(self, key):
+        data = self._read(self._path(key, '.json'))
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def put_json(self, key, obj):
+        self._write(self._path(key, '.json'), json.dumps(obj).encode())
+
+    def get_array(self, key):
+        data = self._read(self._path(key, '.npz'))
+        if data is None:
+            return None
+        try:
+            with np.load(io.BytesIO(data)) as npz:
+                return npz['data']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put_array(self, key, arr):
+        buf = io.BytesIO()
+        np.savez_compressed(buf, data=arr)
+        self._write(self._path(key, '.npz'), buf.getvalue())
+
+    def entries(self):
+        """List (mtime, size, path) for every cache entry."""
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.append((st.st_mtime, st.st_size, path))
+        return found
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        self._size = total
+        self._writes = 0
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+import processor
+
+
+def rotate(lines, degrees):
+    angle = np.radians(degrees)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    return (lines.reshape(-1, 2) @ rotation.T).reshape(-1, 4).astype(np.float32)
+
+
+@pytest.mark.parametrize('degrees', [0.0, 90.0, 180.0, -90.0, 37.0])
+def test_jittered_fragments_merge_across_bin_edges(degrees):
+    # Two collinear fragments tilted +0.07 and -0.07 degrees around an axis
+    fragments = np.array([[0, 10, 40, 10.05], [42, 10.05, 80, 10]], dtype=np.float32)
+    merged = processor.merge_collinear_segments(rotate(fragments, degrees))
+    assert len(merged) == 1
+    assert np.hypot(*(merged[0, 2:] - merged[0, :2])) == pytest.approx(80.0, abs=0.01)
+
+
+def test_keeps_opposite_directions_and_separate_lines_apart():
+    lines = np.array([[0, 0, 50, 0],      # one side of a stroke
+                      [50, 0.5, 0, 0.5],  # the other side, opposite direction
+                      [0, 6, 50, 6],      # a parallel line one wall gap away
+                      [60, 0, 90, 0]],    # collinear, but 10 px along the line
+                     dtype=np.float32)
+    assert np.array_equal(processor.merge_collinear_segments(lines), lines)
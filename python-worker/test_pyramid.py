@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+import processor
+from benchmark import load_cleaned_binary, wall_agreement
+
+PLAN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'images',
+                    'electric-plan-plain-full-clean-2025-12-12.jpg')
+
+
+@pytest.fixture(scope='module')
+def cleaned():
+    if not os.path.exists(PLAN):
+        pytest.skip("sample plan not available")
+    return load_cleaned_binary(PLAN)[1]
+
+
+def test_rois_cover_every_wall_pixel(cleaned):
+    covered = cleaned == 0
+    for (x0, y0, x1, y1), mask in processor.plan_pyramid_rois(cleaned):
+        covered[y0:y1, x0:x1] |= mask
+    assert covered.all()
+
+
+@pytest.mark.parametrize('path', ['ridge', 'parallel'])
+def test_pyramid_walls_agree_with_full_resolution(cleaned, path):
+    height, width = cleaned.shape
+    rois = processor.plan_pyramid_rois(cleaned)
+    if path == 'ridge':
+        full = processor.detect_filled_walls_ridge(cleaned, width, height)
+        pyramid = processor.detect_filled_walls_pyramid(cleaned, rois, width, height)
+    else:
+        full = processor.detect_hollow_walls_parallel(cleaned, width, height)
+        pyramid = processor.detect_hollow_walls_pyramid(cleaned, rois, width, height)
+
+    precision, recall = wall_agreement(pyramid, full, width, height, tolerance=1.0)
+    assert precision >= processor.PYRAMID_AGREEMENT
+    assert recall >= processor.PYRAMID_AGREEMENT
@@ -0,0 +1,195 @@
+import struct
+
+import numpy as np
+
+
+# Wall sources, stored as small integer codes in WallSet.source
+SOURCES = ('ridge', 'parallel', 'dual_confirmed')
+SOURCE_CODES = {name: code for code, name in enumerate(SOURCES)}
+
+# Binary wall format (see encode_binary). Every section starts 4-byte aligned
+# so readers can view it in place as a typed array.
+BINARY_MAGIC = b'WALL'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sHHIIf')  # magic, version, coord format, walls, points, coord scale
+COORD_FORMATS = {'f32': 0, 'u16': 1}
+U16_SCALE = 100.0 / 65535  # uint16 step in 0-100 coordinate units
+
+
+class WallSet:
+    """
+    Columnar store for wall centerlines.
+
+    All walls share one (N, 2) float32 coordinate buffer; wall k owns rows
+    offsets[k]:offsets[k + 1]. Per-wall attributes are parallel columns:
+    source (uint8 code into SOURCES), thickness_px, confidence and
+    length_normalized. ids carries a caller-assigned wall id through take()
+    and concat() (-1 = unassigned). Walls are expected to have at least one point.
+    """
+
+    __slots__ = ('coords', 'offsets', 'source', 'thickness', 'confidence', 'length', 'ids')
+
+    def __init__(self, coords, offsets, source, thickness, confidence, length, ids=None):
+        self.coords = np.asarray(coords, dtype=np.float32).reshape(-1, 2)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.source = np.asarray(source, dtype=np.uint8)
+        self.thickness = np.asarray(thickness, dtype=np.float32)
+        self.confidence = np.asarray(confidence, dtype=np.float32)
+        self.length = np.asarray(length, dtype=np.float32)
+        self.ids = np.full(len(self.offsets) - 1, -1, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty((0, 2)), [0], [], [], [], [])
+
+    @classmethod
+    def from_polylines(cls, coords, counts, source, thickness, confidence, length):
+        """
+        Build a WallSet from flat coordinates plus per-wall point counts.
+        source may be a name from SOURCES (applied to every wall) or an array
+        of codes; confidence may be a scalar.
+        """
+        counts = np.asarray(counts, dtype=np.int64)
+        n = len(counts)
+        if isinstance(source, str):
+            source = np.full(n, SOURCE_CODES[source], dtype=np.uint8)
+        return cls(coords, np.r_[0, np.cumsum(counts)], source, thickness,
+                   np.broadcast_to(np.asarray(confidence, dtype=np.float32), (n,)), length)
+
+    @classmethod
+    def from_records(cls, records):
+        """Inverse of to_records()."""
+        counts = [len(r['coords']) for r in records]
+        coords = [p for r in records for p in r['coords']]
+        return cls.from_polylines(np.asarray(coords, dtype=np.float64).reshape(-1, 2), counts,
+                                  np.array([SOURCE_CODES[r['source']] for r in records], dtype=np.uint8),
+                                  [r['thickness_px'] for r in records],
+                                  [r['confidence'] for r in records],
+                                  np.zeros(len(records)))
+
+    @classmethod
+    def concat(cls, sets):
+        sets = [s for s in sets if len(s)]
+        if not sets:
+            return cls.empty()
+        starts = np.cumsum([0] + [len(s.coords) for s in sets[:-1]])
+        offsets = np.concatenate([[0]] + [s.offsets[1:] + start for s, start in zip(sets, starts)])
+        return cls(np.concatenate([s.coords for s in sets]), offsets,
+                   np.concatenate([s.source for s in sets]),
+                   np.concatenate([s.thickness for s in sets]),
+                   np.concatenate([s.confidence for s in sets]),
+                   np.concatenate([s.length for s in sets]),
+                   np.concatenate([s.ids for s in sets]))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def wall_coords(self, k):
+        """Coordinates of wall k as a view into the shared buffer."""
+        return self.coords[self.offsets[k]:self.offsets[k + 1]]
+
+    def take(self, indices):
+        """New WallSet with the walls at indices (or a boolean mask), in that order."""
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        counts = self.counts[indices]
+        # Gather each selected wall's rows: its start plus 0..count-1
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = np.repeat(self.offsets[:-1][indices], counts) + local
+        return WallSet(self.coords[rows], np.r_[0, np.cumsum(counts)], self.source[indices],
+                       self.thickness[indices], self.confidence[indices], self.length[indices],
+                       self.ids[indices])
+
+    def bounds(self):
+        """Per-wall bounding boxes as an (N, 4) array of (minx, miny, maxx, maxy)."""
+        if not len(self):
+            return np.empty((0, 4), dtype=np.float64)
+        starts = self.offsets[:-1]
+        return np.hstack([np.minimum.reduceat(self.coords, starts, axis=0),
+                          np.maximum.reduceat(self.coords, starts, axis=0)]).astype(np.float64)
+
+    def count(self, source):
+        return int(np.count_nonzero(self.source == SOURCE_CODES[source]))
+
+    def to_records(self, with_ids=False):
+        """
+        Walls as JSON-ready dicts. Coordinates are 0-100 percentages kept to 3
+        decimals and thicknesses to 2, so float32 storage noise is rounded away.
+        with_ids adds each wall's id as 'id'.
+        """
+        coords = np.round(self.coords.astype(np.float64), 3).tolist()
+        thickness = np.round(self.thickness.astype(np.float64), 2).tolist()
+        confidence = np.round(self.confidence.astype(np.float64), 2).tolist()
+        offsets = self.offsets.tolist()
+        records = [{'coords': coords[offsets[k]:offsets[k + 1]],
+                    'source': SOURCES[code],
+                    'thickness_px': thickness[k],
+                    'confidence': confidence[k]}
+                   for k, code in enumerate(self.source.tolist())]
+        if with_ids:
+            for record, wall_id in zip(records, self.ids.tolist()):
+                record['id'] = wall_id
+        return records
+
+
+def _pad4(data):
+    return data + b'\0' * (-len(data) % 4)
+
+def encode_binary(walls, coord_format='f32'):
+    """
+    Encode walls (0-100 coordinates) as little-endian binary:
+
+        header      BINARY_HEADER (20 bytes)
+        coords      points x 2, float32 or uint16 (value * coord scale)
+        offsets     walls + 1, uint32
+        thickness   walls, float32
+        confidence  walls, float32
+        source      walls, uint8 (index into SOURCES)
+
+    uint16 coordinates quantize 0-100 to 65535 steps (~0.0015 units).
+    """
+    if coord_format == 'u16':
+        scale = U16_SCALE
+        coords = np.round(np.clip(walls.coords, 0.0, 100.0) / scale).astype('<u2')
+    elif coord_format == 'f32':
+        scale = 1.0
+        coords = walls.coords.astype('<f4')
+    else:
+        raise ValueError(f"Unknown coordinate format: {coord_format}")
+
+    header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, COORD_FORMATS[coord_format],
+                                len(walls), len(walls.coords), scale)
+    return b''.join([header,
+                     _pad4(coords.tobytes()),
+                     walls.offsets.astype('<u4').tobytes(),
+                     walls.thickness.astype('<f4').tobytes(),
+                     walls.confidence.astype('<f4').tobytes(),
+                     walls.source.astype(np.uint8).tobytes()])
+
+def decode_binary(data):
+    """Read encode_binary() output back into a WallSet (float32 coordinates are used in place)."""
+    magic, version, coord_format, n_walls, n_points, scale = BINARY_HEADER.unpack_from(data, 0)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError("Not a version 1 wall binary")
+
+    pos = BINARY_HEADER.size
+
+    def section(dtype, count):
+        nonlocal pos
+        arr = np.frombuffer(data, dtype=dtype, count=count, offset=pos)
+        pos += arr.nbytes + (-arr.nbytes % 4)
+        return arr
+
+    coords = section('<u2' if coord_format == COORD_FORMATS['u16'] else '<f4', n_points * 2)
+    if coord_format == COORD_FORMATS['u16']:
+        coords = coords * np.float32(scale)
+    offsets = section('<u4', n_walls + 1)
+    thickness = section('<f4', n_walls)
+    confidence = section('<f4', n_walls)
+    source = section(np.uint8, n_walls)
+    return WallSet(coords, offsets, source, thickness, confidence, np.zeros(n_walls))
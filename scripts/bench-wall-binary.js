@@ -0,0 +1,33 @@
+// Parse-time benchmark for vectorizer output, run by
+// `python-worker/benchmark.py output_format`.
+//
+//   node scripts/bench-wall-binary.js <repeat> <file> [<file> ...]
+//
+// .json files are read and JSON.parse'd; anything else is read and viewed
+// with readWallBinary(). Prints { file: median milliseconds } as JSON.
+import fs from 'fs';
+import { readWallBinary } from '../wallBinary.js';
+
+const [repeatArg, ...files] = process.argv.slice(2);
+const repeat = Math.max(1, parseInt(repeatArg, 10) || 1);
+
+const median = (values) => {
+    const sorted = [...values].sort((a, b) => a - b);
+    return sorted[Math.floor(sorted.length / 2)];
+};
+
+const results = {};
+for (const file of files) {
+    const load = file.endsWith('.json')
+        ? () => JSON.parse(fs.readFileSync(file, 'utf8'))
+        : () => readWallBinary(fs.readFileSync(file));
+    load(); // warm up
+    const timings = [];
+    for (let i = 0; i < repeat; i++) {
+        const start = process.hrtime.bigint();
+        load();
+        timings.push(Number(process.hrtime.bigint() - start) / 1e6);
+    }
+    results[file] = median(timings);
+}
+console.log(JSON.stringify(results));
@@ -1,10 +1,12 @@
 import express from 'express';
 import bodyParser from 'body-parser';
 import cors from 'cors';
+import crypto from 'crypto';
 import fs from 'fs';
+import os from 'os';
 import path from 'path';
 import { fileURLToPath } from 'url';
-import { exec } from 'child_process';
+import { VectorizerPool } from './vectorizerPool.js';
 
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
@@ -520,39 +522,109 @@ app.post('/api/debug-log', (req, res) => {
 // --- VECTORIZATION BRIDGE ---
 
 
+// Persistent `processor.py --serve` workers (modules imported once per worker)
+const VECTORIZER_SCRIPT = path.join(__dirname, 'python-worker', 'processor.py');
+const vectorizerPool = new VectorizerPool(VECTORIZER_SCRIPT, parseInt(process.env.VECTORIZER_WORKERS || '1', 10));
+// Threads per request for the concurrent symbol/ridge/parallel passes
+const VECTORIZER_THREADS = parseInt(process.env.VECTORIZER_THREADS || String(Math.min(3, os.cpus().length)), 10);
+
 const IMAGE_MAP = {
     'ELECTRIC': path.join(__dirname, 'images', 'electric-plan-plain-full-clean-2025-12-12.jpg'),
     'CLEAN': path.join(__dirname, 'images', 'floor-plan-clean.jpg')
 };
 
+// Binary wall files (format 'f32' / 'u16'), served by GET /api/vectorize/walls/:name
+const VECTORIZER_OUTPUT_DIR = path.join(os.tmpdir(), 'vectorizer');
+const BINARY_WALL_FORMATS = ['f32', 'u16'];
+// Wall files (and their .json sidecars) older than this are deleted
+const VECTORIZER_OUTPUT_MAX_AGE_MS = 60 * 60 * 1000;
+
+function pruneVectorizerOutput() {
+    try {
+        const cutoff = Date.now() - VECTORIZER_OUTPUT_MAX_AGE_MS;
+        for (const name of fs.readdirSync(VECTORIZER_OUTPUT_DIR)) {
+            const filePath = path.join(VECTORIZER_OUTPUT_DIR, name);
+            if (fs.statSync(filePath).mtimeMs < cutoff) {
+                fs.unlinkSync(filePath);
+            }
+        }
+    } catch (pruneErr) {
+        console.error('Failed to prune vectorizer output:', pruneErr);
+    }
+}
+
 app.post('/api/vectorize', (req, res) => {
-    const { imageType } = req.body;
+    const { imageType, format = 'json', preview, pyramid, roi } = req.body;
     const imagePath = IMAGE_MAP[imageType];
 
     if (!imagePath || !fs.existsSync(imagePath)) {
         console.error(`Vectorization failed: Image not found ${imagePath}`);
         return res.status(404).json({ error: 'Image file not found on server' });
     }
+    if (format !== 'json' && format !== 'ndjson' && !BINARY_WALL_FORMATS.includes(format)) {
+        return res.status(400).json({ error: `Unknown vectorizer format: ${format}` });
+    }
 
-    const scriptPath = path.join(__dirname, 'python-worker', 'processor.py');
-    const command = `python3 "${scriptPath}" --input "${imagePath}"`;
+    console.log(`Running Vectorization: ${imagePath}`);
+
+    const params = { input: imagePath, threads: VECTORIZER_THREADS };
+    // Draft walls from a 1/2, 1/4 or 1/8 resolution decode
+    if (preview) params.preview = preview;
+    // Coarse-to-fine: full-resolution detection only in regions found at 1/4 scale
+    if (pyramid) params.pyramid = true;
+    // Re-vectorize only [x, y, w, h] (0-100 page coordinates); walls are clipped to it
+    if (roi) params.roi = roi;
+
+    if (format === 'ndjson') {
+        // Forward each record as the worker emits it instead of buffering the result
+        res.type('application/x-ndjson');
+        vectorizerPool.vectorizeStream(params, record => res.write(JSON.stringify(record) + '\n'))
+            .then(() => res.end())
+            .catch(err => {
+                console.error(`Vectorization Error: ${err.message}`);
+                res.end(JSON.stringify({ type: 'error', message: err.message }) + '\n');
+            });
+        return;
+    }
 
-    console.log(`Running Vectorization: ${command}`);
+    let wallsFile = null;
+    if (format !== 'json') {
+        // Walls go to a binary file (loadable with wallBinary.js); the response
+        // carries metadata and symbols plus the URL to fetch the walls from
+        fs.mkdirSync(VECTORIZER_OUTPUT_DIR, { recursive: true });
+        pruneVectorizerOutput();
+        // Unique per request, so concurrent requests never share a file
+        wallsFile = `${imageType.toLowerCase()}-${crypto.randomUUID()}.${format}.walls`;
+        params.format = format;
+        params.output = path.join(VECTORIZER_OUTPUT_DIR, wallsFile);
+    }
 
-    exec(command, { maxBuffer: 1024 * 1024 * 10 }, (error, stdout, stderr) => {
-        if (error) {
-            console.error(`Vectorization Exec Error: ${error.message}`);
-            return res.status(500).json({ error: 'Failed to execute vectorizer', details: stderr });
-        }
-        try {
-            // Python script prints JSON to stdout
-            const result = JSON.parse(stdout);
+    vectorizerPool.vectorize(params)
+        .then(result => {
+            if (wallsFile) {
+                const { path: _path, ...layout } = result.walls_binary;
+                result.walls_binary = { ...layout, url: `/api/vectorize/walls/${wallsFile}` };
+            }
             res.json(result);
-        } catch (parseError) {
-            console.error(`Vectorization Parse Error: ${parseError.message}`, stdout);
-            res.status(500).json({ error: 'Invalid output from vectorizer', output: stdout });
-        }
-    });
+        })
+        .catch(err => {
+            console.error(`Vectorization Error: ${err.message}`);
+            if (wallsFile) {
+                for (const filePath of [params.output, `${params.output}.json`]) {
+                    fs.rmSync(filePath, { force: true });
+                }
+            }
+            res.status(500).json({ error: 'Failed to execute vectorizer', details: err.message });
+        });
+});
+
+app.get('/api/vectorize/walls/:name', (req, res) => {
+    const name = path.basename(req.params.name);
+    const filePath = path.join(VECTORIZER_OUTPUT_DIR, name);
+    if (name !== req.params.name || !name.endsWith('.walls') || !fs.existsSync(filePath)) {
+        return res.status(404).json({ error: 'Wall file not found' });
+    }
+    res.type('application/octet-stream').sendFile(filePath);
 });
 
 // --- DATA LOADING & BOM CALCULATION ---
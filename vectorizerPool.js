@@ -0,0 +1,139 @@
+import { spawn } from 'child_process';
+import readline from 'readline';
+
+// ============================================================================
+// VECTORIZER WORKER POOL
+// ============================================================================
+// Keeps a few `processor.py --serve` workers alive so each /api/vectorize call
+// only pays for the image work, not interpreter startup and cv2/skimage/shapely
+// imports. Workers speak line-delimited JSON: one request per line on stdin,
+// one response per line on stdout. Streamed requests (format "ndjson") also
+// get {id, stream: record} lines before their response. Diagnostics go to stderr.
+
+class VectorizerWorker {
+    constructor(scriptPath, index, onIdle) {
+        this.index = index;
+        this.onIdle = onIdle;
+        this.pending = new Map();
+        this.busy = false;
+        this.alive = true;
+
+        this.proc = spawn('python3', [scriptPath, '--serve'], { stdio: ['pipe', 'pipe', 'pipe'] });
+
+        readline.createInterface({ input: this.proc.stdout, crlfDelay: Infinity })
+            .on('line', (line) => this.handleLine(line));
+
+        readline.createInterface({ input: this.proc.stderr, crlfDelay: Infinity })
+            .on('line', (line) => console.log(`[vectorizer:${this.index}] ${line}`));
+
+        this.proc.on('exit', (code, signal) => {
+            this.fail(`Vectorizer worker exited (code=${code}, signal=${signal})`);
+        });
+
+        this.proc.on('error', (err) => {
+            this.fail(`Vectorizer worker failed: ${err.message}`);
+        });
+
+        // Writes to a dead worker surface here instead of crashing the server
+        this.proc.stdin.on('error', (err) => {
+            console.error(`[vectorizer:${this.index}] stdin error: ${err.message}`);
+        });
+    }
+
+    fail(reason) {
+        if (!this.alive) return;
+        this.alive = false;
+        console.error(`[vectorizer:${this.index}] ${reason}`);
+        for (const { reject } of this.pending.values()) {
+            reject(new Error(reason));
+        }
+        this.pending.clear();
+        this.onIdle(this);
+    }
+
+    handleLine(line) {
+        let response;
+        try {
+            response = JSON.parse(line);
+        } catch (parseError) {
+            console.error(`[vectorizer:${this.index}] Invalid response line: ${line.substring(0, 200)}`);
+            return;
+        }
+
+        const job = this.pending.get(response.id);
+        if (!job) return;
+        if (response.stream !== undefined) {
+            if (job.onRecord) job.onRecord(response.stream);
+            return;
+        }
+        this.pending.delete(response.id);
+        this.busy = false;
+
+        if (response.error) {
+            job.reject(new Error(response.error.message));
+        } else {
+            job.resolve(response.result);
+        }
+        this.onIdle(this);
+    }
+
+    send(id, method, params, resolve, reject, onRecord) {
+        this.busy = true;
+        this.pending.set(id, { resolve, reject, onRecord });
+        this.proc.stdin.write(JSON.stringify({ id, method, params }) + '\n');
+    }
+
+    stop() {
+        if (this.alive) this.proc.stdin.end();
+    }
+}
+
+export class VectorizerPool {
+    constructor(scriptPath, size = 1) {
+        this.scriptPath = scriptPath;
+        this.size = Math.max(1, size);
+        this.workers = [];
+        this.queue = [];
+        this.nextId = 1;
+        this.nextWorkerIndex = 0;
+    }
+
+    request(method, params, onRecord = null) {
+        return new Promise((resolve, reject) => {
+            this.queue.push({ id: this.nextId++, method, params, resolve, reject, onRecord });
+            this.dispatch();
+        });
+    }
+
+    vectorize(params) {
+        return this.request('vectorize', params);
+    }
+
+    // Streamed vectorize: onRecord gets each NDJSON record as the pipeline
+    // produces it; the promise settles once the run is complete
+    vectorizeStream(params, onRecord) {
+        return this.request('vectorize', { ...params, format: 'ndjson' }, onRecord);
+    }
+
+    dispatch() {
+        // Drop workers that died; replacements are spawned on demand
+        this.workers = this.workers.filter(w => w.alive);
+
+        while (this.queue.length > 0) {
+            let worker = this.workers.find(w => !w.busy);
+            if (!worker && this.workers.length < this.size) {
+                worker = new VectorizerWorker(this.scriptPath, this.nextWorkerIndex++, () => this.dispatch());
+                this.workers.push(worker);
+            }
+            if (!worker) return;
+
+            const job = this.queue.shift();
+            worker.send(job.id, job.method, job.params, job.resolve, job.reject, job.onRecord);
+        }
+    }
+
+    shutdown() {
+        for (const worker of this.workers) worker.stop();
+        this.workers = [];
+    }
+}
@@ -0,0 +1,88 @@
+// ============================================================================
+// BINARY WALL FORMAT READER
+// ============================================================================
+// Reads the walls file written by `processor.py --format f32|u16` (see
+// python-worker/wallset.py encode_binary). Sections are 4-byte aligned, so
+// coordinates and columns are typed-array views over the original buffer;
+// nothing is copied or parsed. Works in Node and the browser.
+//
+//   header      magic "WALL", u16 version, u16 coord format, u32 walls, u32 points, f32 coord scale
+//   coords      points * 2, float32 or uint16 (value * coord scale = 0-100 coordinate)
+//   offsets     walls + 1, uint32 (wall k owns points offsets[k] .. offsets[k + 1])
+//   thickness   walls, float32
+//   confidence  walls, float32
+//   source      walls, uint8 (index into WALL_SOURCES)
+
+export const WALL_SOURCES = ['ridge', 'parallel', 'dual_confirmed'];
+
+const HEADER_BYTES = 20;
+const COORD_FORMATS = ['f32', 'u16'];
+
+const align4 = (n) => (n + 3) & ~3;
+
+/**
+ * View a binary walls buffer as typed arrays.
+ * Accepts an ArrayBuffer, or a Node Buffer / Uint8Array over one. A Buffer
+ * whose byteOffset is not 4-byte aligned (small pooled Buffers) is copied once.
+ */
+export function readWallBinary(data) {
+    let buffer = data;
+    let base = 0;
+    if (ArrayBuffer.isView(data)) {
+        if (data.byteOffset % 4 !== 0) {
+            buffer = data.buffer.slice(data.byteOffset, data.byteOffset + data.byteLength);
+        } else {
+            buffer = data.buffer;
+            base = data.byteOffset;
+        }
+    }
+
+    const view = new DataView(buffer, base, HEADER_BYTES);
+    const magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+    const version = view.getUint16(4, true);
+    if (magic !== 'WALL' || version !== 1) {
+        throw new Error('Not a version 1 wall binary');
+    }
+
+    const format = COORD_FORMATS[view.getUint16(6, true)];
+    const wallCount = view.getUint32(8, true);
+    const pointCount = view.getUint32(12, true);
+    const coordScale = view.getFloat32(16, true);
+
+    let pos = base + HEADER_BYTES;
+    const section = (ArrayType, length) => {
+        const arr = new ArrayType(buffer, pos, length);
+        pos += align4(arr.byteLength);
+        return arr;
+    };
+
+    const coords = section(format === 'u16' ? Uint16Array : Float32Array, pointCount * 2);
+    const offsets = section(Uint32Array, wallCount + 1);
+    const thickness = section(Float32Array, wallCount);
+    const confidence = section(Float32Array, wallCount);
+    const source = section(Uint8Array, wallCount);
+
+    return { format, wallCount, pointCount, coordScale, coords, offsets, thickness, confidence, source };
+}
+
+/**
+ * Expand a readWallBinary() result into the JSON `walls` shape
+ * ({ coords: [[x, y], ...], source, thickness_px, confidence }).
+ */
+export function wallsToRecords(walls) {
+    const { coords, offsets, coordScale } = walls;
+    const records = new Array(walls.wallCount);
+    for (let k = 0; k < walls.wallCount; k++) {
+        const points = [];
+        for (let p = offsets[k]; p < offsets[k + 1]; p++) {
+            points.push([coords[2 * p] * coordScale, coords[2 * p + 1] * coordScale]);
+        }
+        records[k] = {
+            coords: points,
+            source: WALL_SOURCES[walls.source[k]],
+            thickness_px: walls.thickness[k],
+            confidence: walls.confidence[k],
+        };
+    }
+    return records;
+}